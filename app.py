@@ -3,43 +3,108 @@ Flask application for the onboarding system.
 Supports both chatbot-based and legacy form-based onboarding.
 """
 
-from flask import Flask, render_template, request, jsonify, session
+import hashlib
+import hmac
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Flask, Response, make_response, render_template, request, jsonify, session, stream_with_context
 from config import (
     Config,
     APP_TITLE,
     ONBOARDING_HEADER,
     ONBOARDING_DESCRIPTION,
     CHATBOT_MODE_LABEL,
-    LEGACY_MODE_LABEL
+    LEGACY_MODE_LABEL,
+    PREWARM_FIRST_TURN,
+    PREWARM_OPENING_TIMEOUT_SECONDS,
+    REGISTRATION_QUEUE_ENABLED,
+    AGENT_WARMUP,
+    AGENT_FALLBACK_ENABLED,
+    BULK_IMPORT_TOKEN,
 )
 
-from custom_funcs.read_sheet import read_sheet_retrieve_questions
-# Import the ADK runner helper that talks to Gemini
-from custom_funcs.agents.agent_singleton import ask_agent
+from custom_funcs.question_cache import question_cache
+# Import the ADK runner helper that talks to Gemini (the runner itself is built lazily)
+from custom_funcs.agents.agent_singleton import (
+    ask_agent,
+    stream_agent,
+    start_session,
+    get_opening_reply,
+    get_collected_answers,
+    warm_up_in_background,
+    AgentOverloadedError,
+    AgentTurnTimeoutError,
+)
+from custom_funcs.agents.health import agent_health
 from uuid import uuid4
 from custom_funcs.supabase_client import create_user
-from typing import List, Dict, Set, Any
+from custom_funcs.registration_queue import get_registration_queue
+from custom_funcs.validation import get_validator
+from custom_funcs.bulk_import import (
+    CSV_CONTENT_TYPES,
+    NDJSON_CONTENT_TYPES,
+    iter_csv_rows,
+    iter_ndjson_rows,
+    import_registrations,
+)
+from custom_funcs.metrics import render_metrics
+from typing import List, Dict, Any, Optional, Tuple
 
 # ---------------- Global helpers ----------------
 
 def _load_questions() -> List[Dict[str, Any]]:
-    """Load questions once at app startup for quick validation."""
-    response = read_sheet_retrieve_questions()
-    if response.get('status') != 'success':
-        return []
-
-    values = response.get('values', [])
-    if not values or len(values) < 2:
-        return []
-
-    headers = values[0]
-    questions: List[Dict[str, Any]] = []
-    for row in values[1:]:
-        if not row:
-            continue
-        question = {headers[i]: row[i] if i < len(row) else '' for i in range(len(headers))}
-        questions.append(question)
-    return questions
+    """Return the question schema from the shared process-wide cache."""
+    return question_cache.get_questions()
+
+
+# Rendered landing page per schema version and initial mode ('chat' or 'form'):
+# (html, etag, last_modified). The page has no per-user content, so it only
+# changes when the sheet does.
+_index_page_cache: "OrderedDict[str, Tuple[str, str, datetime]]" = OrderedDict()
+_index_page_cache_lock = threading.Lock()
+INDEX_PAGE_CACHE_SIZE = 8
+
+
+def _render_index_page(
+    questions: List[Dict[str, Any]], error_message: Optional[str], initial_mode: str = 'chat'
+) -> str:
+    return render_template(
+        'index.html',
+        app_title=APP_TITLE,
+        header=ONBOARDING_HEADER,
+        description=ONBOARDING_DESCRIPTION,
+        questions=questions,
+        chatbot_mode_label=CHATBOT_MODE_LABEL,
+        legacy_mode_label=LEGACY_MODE_LABEL,
+        prewarm_first_turn=PREWARM_FIRST_TURN and initial_mode == 'chat',
+        initial_mode=initial_mode,
+        error_message=error_message
+    )
+
+
+def _cached_index_page(
+    schema_version: str, questions: List[Dict[str, Any]], initial_mode: str = 'chat'
+) -> Tuple[str, str, datetime]:
+    """Return the rendered page for a schema version and initial mode, rendering it only once."""
+    cache_key = f"{schema_version}:{initial_mode}"
+    with _index_page_cache_lock:
+        cached = _index_page_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    html = _render_index_page(questions, error_message=None, initial_mode=initial_mode)
+    etag = hashlib.sha256(html.encode('utf-8')).hexdigest()[:32]
+    cached = (html, etag, datetime.now(timezone.utc).replace(microsecond=0))
+
+    with _index_page_cache_lock:
+        # Keep the first render if another thread got there first, so Last-Modified stays stable
+        cached = _index_page_cache.setdefault(cache_key, cached)
+        while len(_index_page_cache) > INDEX_PAGE_CACHE_SIZE:
+            _index_page_cache.popitem(last=False)
+    return cached
 
 # end of global helpers ----------------------------------------------------
 
@@ -47,6 +112,13 @@ def _load_questions() -> List[Dict[str, Any]]:
 app = Flask(__name__)
 app.config.from_object(Config)
 
+# Warm the question cache so the first page view doesn't wait on Google Sheets
+question_cache.refresh_in_background()
+
+# Build the ADK runner off the request path; with 'lazy' the first chat turn builds it
+if AGENT_WARMUP == 'background':
+    warm_up_in_background()
+
 
 @app.route('/retrieve_all_questions', methods=['GET', 'POST'])
 def retrieve_all_questions_route():
@@ -54,82 +126,67 @@ def retrieve_all_questions_route():
     Route to fetch questions from the admin panel. Currently Google Sheet serves the admin panel purpose.
     Can be called manually or used as a tool by agents.
     """
-    response = read_sheet_retrieve_questions()
+    questions = _load_questions()
 
-    if response.get('status') != 'success':
-        error_msg = response.get('error_message', 'Unknown error occurred')
+    if not questions:
+        error_msg = question_cache.last_error or 'Unknown error occurred'
         return jsonify({
             'success': False,
             'error': f"There's currently an issue loading questions: {error_msg}"
         }), 500
-    
-    values = response.get('values', [])
-    
-    if not values or len(values) < 2:  # Need at least header row + 1 data row
-        return jsonify({
-            'success': False,
-            'error': "There's currently an issue loading questions. Please try again later or contact support."
-        }), 500
-    
-    # First row contains headers
-    headers = values[0]
-    
-    # Convert rows to question dictionaries
-    questions = []
-    for row in values[1:]:  # Skip header row
-        if not row:  # Skip empty rows
-            continue
-        
-        # Create a dictionary mapping headers to values
-        question = {}
-        for i, header in enumerate(headers):
-            # Use empty string if row doesn't have enough columns
-            value = row[i] if i < len(row) else ''
-            question[header] = value
-        
-        questions.append(question)
-    
-    if questions:
-        return jsonify({
-            'success': True,
-            'message': f'Successfully loaded {len(questions)} questions',
-            'questions': questions,
-            'questions_count': len(questions)
-        }), 200
-    else:
-        return jsonify({
-            'success': False,
-            'error': "There's currently an issue loading questions. Please try again later or contact support."
-        }), 500
+
+    return jsonify({
+        'success': True,
+        'message': f'Successfully loaded {len(questions)} questions',
+        'questions': questions,
+        'questions_count': len(questions)
+    }), 200
 
 
 @app.route('/')
 def index():
     """Main onboarding page – defaults to chatbot view."""
-    # Load questions with home page startup
-    questions = _load_questions()
-    # Persist questions for this user session so subsequent API calls can reuse them
-    session['questions'] = questions
+    # Served from the shared cache, never waits on Sheets once warmed up
+    schema_version, questions = question_cache.get_snapshot()
+    # Only the schema version goes into the (cookie) session; the questions
+    # themselves are resolved server-side from the versioned cache
+    session.pop('questions', None)
+    session['schema_version'] = schema_version
 
-    # Force a new chat session ID on every visit to the home page
-    session['chat_session_id'] = str(uuid4())
+    # While agent turns are slow or failing, new visitors get the form first
+    initial_mode = 'form' if AGENT_FALLBACK_ENABLED and agent_health.is_degraded() else 'chat'
+
+    # Keep the last chat that got answers, so the form can be prefilled from it
+    if session.pop('chat_started', False):
+        session['previous_chat_session_id'] = session.get('chat_session_id')
 
+    # Force a new chat session ID on every visit to the home page
+    chat_session_id = str(uuid4())
+    session['chat_session_id'] = chat_session_id
+    # Pre-warm the ADK session (schema seeded, optionally the opening question)
+    # so the first chat turn goes straight to a warm agent
+    start_session(chat_session_id, questions, opening=initial_mode == 'chat')
 
     if not questions:
         error_message = "There's currently an issue loading questions. Please try again later or contact support."
-    else:
-        error_message = None
+        return _render_index_page(questions, error_message)
 
-    return render_template(
-        'index.html',
-        app_title=APP_TITLE,
-        header=ONBOARDING_HEADER,
-        description=ONBOARDING_DESCRIPTION,
-        questions=questions,
-        chatbot_mode_label=CHATBOT_MODE_LABEL,
-        legacy_mode_label=LEGACY_MODE_LABEL,
-        error_message=error_message
-    )
+    html, etag, last_modified = _cached_index_page(schema_version, questions, initial_mode)
+    response = make_response(html)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Browsers/CDNs may keep the page but must revalidate, since every visit
+    # still gets a fresh chat session cookie
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def _agent_overloaded_response(exc: AgentOverloadedError):
+    """503 telling the client when to retry a turn the agent had no capacity for."""
+    response = jsonify({'success': False, 'error': str(exc), 'retry_after': exc.retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(int(exc.retry_after))
+    return response
 
 
 @app.route('/api/agent_chat', methods=['POST'])
@@ -152,9 +209,15 @@ def agent_chat():
     if chat_session_id is None:
         chat_session_id = str(uuid4())
         session['chat_session_id'] = chat_session_id
+    if not session.get('chat_started'):
+        session['chat_started'] = True
 
     try:
         reply = ask_agent(user_message, chat_session_id)
+    except AgentOverloadedError as exc:
+        return _agent_overloaded_response(exc)
+    except AgentTurnTimeoutError as exc:
+        return jsonify({'success': False, 'error': str(exc)}), 504
     except Exception as exc:
         app.logger.exception("Agent failure")
         return jsonify({'success': False, 'error': str(exc)}), 500
@@ -162,33 +225,120 @@ def agent_chat():
     return jsonify({'success': True, 'response': reply}), 200
 
 
+@app.route('/api/agent_chat/opening', methods=['GET'])
+def agent_chat_opening():
+    """Return the agent's pre-generated opening message for this chat session.
+
+    Only available when PREWARM_FIRST_TURN is enabled; the reply is generated in
+    the background when the index page is served.
+        {"success": true, "response": ["..."]}
+    """
+    chat_session_id = session.get('chat_session_id')
+    reply = None
+    if chat_session_id is not None:
+        reply = get_opening_reply(chat_session_id, PREWARM_OPENING_TIMEOUT_SECONDS)
+
+    if reply is None:
+        return jsonify({'success': False, 'error': 'No opening message available'}), 404
+
+    return jsonify({'success': True, 'response': reply}), 200
+
+
+@app.route('/api/agent_chat/stream', methods=['POST'])
+def agent_chat_stream():
+    """Streaming variant of /api/agent_chat using Server-Sent Events.
+
+    Expected request JSON  {"message": "..."}
+    Each text part is sent as soon as the agent produces it:
+        data: {"text": "..."}
+    The stream ends with an `event: done` message, or `event: error` with
+    {"error": "..."} if the turn fails ({"timeout": true} is added when it ran
+    out of time).
+    """
+    data = request.get_json() or {}
+    user_message = data.get('message', '')
+    if not user_message:
+        return jsonify({'success': False, 'error': 'message field required'}), 400
+
+    # Resolve the session id before streaming starts; the cookie can't change afterwards
+    chat_session_id = session.get('chat_session_id')
+    if chat_session_id is None:
+        chat_session_id = str(uuid4())
+        session['chat_session_id'] = chat_session_id
+    if not session.get('chat_started'):
+        session['chat_started'] = True
+
+    # Admission happens before streaming starts, so a full queue is still a plain 503
+    try:
+        parts = stream_agent(user_message, chat_session_id)
+    except AgentOverloadedError as exc:
+        return _agent_overloaded_response(exc)
+
+    def generate():
+        try:
+            for part in parts:
+                yield f"data: {json.dumps({'text': part})}\n\n"
+        except AgentTurnTimeoutError as exc:
+            # `timeout` lets the page offer the form instead
+            yield f"event: error\ndata: {json.dumps({'error': str(exc), 'timeout': True})}\n\n"
+            return
+        except Exception as exc:
+            app.logger.exception("Agent failure")
+            yield f"event: error\ndata: {json.dumps({'error': str(exc)})}\n\n"
+            return
+        yield "event: done\ndata: {}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+@app.route('/api/form_prefill', methods=['GET'])
+def form_prefill():
+    """Answers the agent already collected, used to prefill the form when switching away from the chat.
+
+        {"success": true, "values": {"<questioned_entity>": "..."}}
+    """
+    questions = question_cache.get_version(session.get('schema_version')) or _load_questions()
+    accepted_fields = {question.get('questioned_entity') for question in questions}
+
+    session_ids = [session.get('previous_chat_session_id')]
+    if session.get('chat_started'):
+        session_ids.append(session.get('chat_session_id'))
+
+    values: Dict[str, Any] = {}
+    # The current chat's answers win over those of the previous one
+    for chat_session_id in filter(None, session_ids):
+        values.update(get_collected_answers(chat_session_id))
+
+    return jsonify({
+        'success': True,
+        'values': {key: value for key, value in values.items() if key in accepted_fields},
+    }), 200
+
+
 # ---------------- REGISTRATION ----------------
 
+QUESTIONS_UNAVAILABLE_ERROR = "Registration is temporarily unavailable, please try again later."
+
+
 # Validation helper
 def _validate_registration_payload(payload: Dict[str, Any], questions: List[Dict[str, Any]]):
     """Return (is_valid: bool, error_message: str)."""
     if not questions:
-        # If questions failed to load, skip validation to avoid blocking registrations
-        return True, ""
-
-    accepted_fields: Set[str] = {q.get('questioned_entity') for q in questions if q.get('questioned_entity')}
-    required_fields: Set[str] = {
-        q.get('questioned_entity')
-        for q in questions
-        if q.get('questioned_entity') and q.get('is_mandatory', '').upper() == 'Y'
-    }
+        # Never accept unvalidated data; the on-disk snapshot makes this a rare case
+        return False, QUESTIONS_UNAVAILABLE_ERROR
 
-    # Check for required fields
-    missing = required_fields - payload.keys()
-    if missing:
-        return False, f"Missing required fields: {', '.join(sorted(missing))}"
+    # Compiled once per schema version: required/accepted fields plus type, regex,
+    # enum and length constraints from the sheet
+    return get_validator(questions).validate(payload)
 
-    # Check for unexpected fields
-    unexpected = set(payload.keys()) - accepted_fields
-    if unexpected:
-        return False, f"Unexpected fields detected: {', '.join(sorted(unexpected))}"
 
-    return True, ""
+def _payload_idempotency_key(prefix: str, payload: Dict[str, Any]) -> str:
+    """Stable idempotency key for a registration payload."""
+    return f"{prefix}:" + hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
 
 
 @app.route('/api/register', methods=['POST'])
@@ -200,21 +350,116 @@ def register():
     data = request.get_json() or {}
     app.logger.debug("Registration request received: %s", data)
 
-    # Retrieve questions from session or fall back to fresh load
-    questions = session.get('questions') or _load_questions()
+    # Validate against the schema version this user was shown, or the current one
+    questions = question_cache.get_version(session.get('schema_version')) or _load_questions()
+    if not questions:
+        return jsonify({"success": False, "error": QUESTIONS_UNAVAILABLE_ERROR}), 503
 
     # Dynamic validation against current questions
     is_valid, error_msg = _validate_registration_payload(data, questions)
     if not is_valid:
         return jsonify({"success": False, "error": error_msg}), 400
 
+    # A client-supplied key wins; otherwise identical resubmissions share one key
+    idempotency_key = request.headers.get('Idempotency-Key') or _payload_idempotency_key("form", data)
+
+    if REGISTRATION_QUEUE_ENABLED:
+        # Write-behind: acknowledge now, the queue forwards to Supabase in the background.
+        registration_id, _ = get_registration_queue().enqueue(data, idempotency_key)
+        session.pop('previous_chat_session_id', None)
+        return jsonify({
+            "success": True,
+            "status": "queued",
+            "registration_id": registration_id,
+        }), 202
+
     # Forward the entire payload to Supabase
     # print(data)
-    result = create_user(data)
+    result = create_user(data, idempotency_key=idempotency_key)
+    if result.get('success'):
+        # Nothing left to prefill on this browser
+        session.pop('previous_chat_session_id', None)
 
     return jsonify(result), result.get('status_code', 500)
 
 
+@app.route('/api/register/bulk', methods=['POST'])
+def register_bulk():
+    """
+    Bulk registration import, e.g. when migrating users from the old forms.
+
+    Accepts a streamed body, either CSV (`text/csv`, header row with the
+    questioned entities) or NDJSON (`application/x-ndjson`, one JSON object per
+    line). Rows are validated one by one and valid rows are forwarded in
+    concurrent batches. The response reports per-row errors and rows per second.
+
+    Callers authenticate with `Authorization: Bearer <BULK_IMPORT_TOKEN>`; without
+    a configured token the endpoint is disabled.
+    """
+    if not BULK_IMPORT_TOKEN:
+        return jsonify({"success": False, "error": "Bulk import is disabled"}), 404
+    supplied = request.headers.get('Authorization', '').encode()
+    if not hmac.compare_digest(supplied, f"Bearer {BULK_IMPORT_TOKEN}".encode()):
+        return jsonify({"success": False, "error": "Unauthorized"}), 401
+
+    content_type = (request.mimetype or '').lower()
+    if content_type in CSV_CONTENT_TYPES:
+        rows = iter_csv_rows(request.stream)
+    elif content_type in NDJSON_CONTENT_TYPES:
+        rows = iter_ndjson_rows(request.stream)
+    else:
+        return jsonify({
+            "success": False,
+            "error": "Unsupported content type, send text/csv or application/x-ndjson"
+        }), 415
+
+    questions = _load_questions()
+    if not questions:
+        return jsonify({"success": False, "error": QUESTIONS_UNAVAILABLE_ERROR}), 503
+
+    def sender(payload: Dict[str, Any]) -> Dict[str, Any]:
+        return create_user(payload, idempotency_key=_payload_idempotency_key("bulk", payload))
+
+    if REGISTRATION_QUEUE_ENABLED:
+        registration_queue = get_registration_queue()
+
+        def sender(payload: Dict[str, Any]) -> Dict[str, Any]:
+            registration_id, _ = registration_queue.enqueue(payload, _payload_idempotency_key("bulk", payload))
+            return {"success": True, "registration_id": registration_id}
+
+    summary = import_registrations(
+        rows,
+        validate=lambda payload: _validate_registration_payload(payload, questions),
+        sender=sender,
+    )
+    app.logger.info(
+        "Bulk import: %d rows, %d invalid, %d sent, %d failed, %.1f rows/s",
+        summary["rows_total"], summary["rows_invalid"], summary["rows_sent"],
+        summary["rows_failed"], summary["rows_per_second"],
+    )
+
+    return jsonify({"success": summary["rows_failed"] == 0 and summary["rows_invalid"] == 0, **summary}), 200
+
+
+@app.route('/api/register/status/<registration_id>', methods=['GET'])
+def registration_status(registration_id: str):
+    """Report the outcome of a queued registration (pending/processing/succeeded/failed)."""
+    if not REGISTRATION_QUEUE_ENABLED:
+        return jsonify({"success": False, "error": "Registration queue is not enabled"}), 404
+
+    status = get_registration_queue().get_status(registration_id)
+    if status is None:
+        return jsonify({"success": False, "error": "Unknown registration id"}), 404
+
+    return jsonify({"success": True, **status}), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose latency, token and client metrics in the Prometheus text format."""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 
 
 
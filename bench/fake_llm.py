@@ -0,0 +1,146 @@
+"""
+Scripted stand-in for Gemini used by the offline benchmark.
+
+It plays the onboarding agent deterministically through the real tools:
+
+- a user message is saved as the answer to the question asked last
+  (found through the `[ask:<entity>]` marker in the agent's previous reply),
+  or, if no question was asked yet, `save_answers_and_get_next({})` fetches
+  the pending questions;
+- a tool response with pending questions becomes the next question;
+- once nothing is pending, `register_user_in_db` is called and the reply
+  ends with `[registered]`.
+
+Requests without tools are summarization requests from events compaction;
+the summary keeps the last question marker so the next turn still knows it.
+"""
+
+import asyncio
+import json
+import random
+import re
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from pydantic import PrivateAttr
+
+ASK_MARKER_RE = re.compile(r"\[ask:([\w-]+)\]")
+REGISTERED_MARKER = "[registered]"
+REGISTRATION_FAILED_MARKER = "[registration_failed]"
+
+
+def _content_text(content: types.Content) -> str:
+    return " ".join(part.text for part in content.parts or [] if part.text)
+
+
+def _estimate_tokens(text: str) -> int:
+    # Roughly four characters per token, like Gemini on English text
+    return max(1, len(text) // 4)
+
+
+class ScriptedLlm(BaseLlm):
+    """Deterministic onboarding 'model' with a configurable response latency."""
+
+    model: str = "scripted-onboarding-llm"
+    latency_seconds: float = 0.0
+    jitter_seconds: float = 0.0
+
+    _calls: int = PrivateAttr(default=0)
+
+    @property
+    def calls(self) -> int:
+        """LLM calls served so far (all on the agent's event loop thread)."""
+        return self._calls
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        self._calls += 1
+        delay = self.latency_seconds + random.uniform(0, self.jitter_seconds)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if not llm_request.tools_dict:
+            content = self._summary(llm_request.contents)
+        else:
+            content = self._next_step(llm_request.contents)
+
+        yield LlmResponse(content=content, usage_metadata=self._usage(llm_request, content))
+
+    # ---------------- script ----------------
+
+    def _next_step(self, contents: List[types.Content]) -> types.Content:
+        last = contents[-1]
+        responses = [part.function_response for part in last.parts or [] if part.function_response]
+        if responses:
+            return self._after_tool(responses[-1].name, responses[-1].response or {})
+
+        entity = self._last_asked_entity(contents[:-1])
+        data = {entity: _content_text(last).strip()} if entity else {}
+        return self._call("save_answers_and_get_next", {"data": data})
+
+    def _after_tool(self, name: str, response: Dict[str, Any]) -> types.Content:
+        if name == "register_user_in_db":
+            if response.get("success"):
+                return self._say(f"You're all set, thanks for registering! {REGISTERED_MARKER}")
+            return self._say(f"Registration failed: {response.get('error')} {REGISTRATION_FAILED_MARKER}")
+
+        if "pending" not in response:
+            return self._call("save_answers_and_get_next", {"data": {}})
+
+        errors = response.get("errors") or {}
+        if errors:
+            entity, reason = next(iter(errors.items()))
+            return self._say(f"Sorry, your {entity} {reason}. Could you try again? [ask:{entity}]")
+
+        pending = response["pending"]
+        if pending:
+            question = pending[0]
+            return self._say(f"{question.get('question_example')} [ask:{question.get('entity')}]")
+        return self._call("register_user_in_db", {})
+
+    @staticmethod
+    def _last_asked_entity(contents: List[types.Content]) -> Optional[str]:
+        for content in reversed(contents):
+            if content.role != "model":
+                continue
+            markers = ASK_MARKER_RE.findall(_content_text(content))
+            if markers:
+                return markers[-1]
+        return None
+
+    def _summary(self, contents: List[types.Content]) -> types.Content:
+        markers = ASK_MARKER_RE.findall(" ".join(_content_text(content) for content in contents))
+        suffix = f" Last question: [ask:{markers[-1]}]" if markers else ""
+        return self._say(f"The user is answering onboarding questions.{suffix}")
+
+    # ---------------- response helpers ----------------
+
+    @staticmethod
+    def _say(text: str) -> types.Content:
+        return types.Content(role="model", parts=[types.Part(text=text)])
+
+    @staticmethod
+    def _call(name: str, args: Dict[str, Any]) -> types.Content:
+        return types.Content(
+            role="model", parts=[types.Part(function_call=types.FunctionCall(name=name, args=args))]
+        )
+
+    @staticmethod
+    def _usage(llm_request: LlmRequest, content: types.Content) -> types.GenerateContentResponseUsageMetadata:
+        prompt = json.dumps(
+            [item.model_dump(mode="json", exclude_none=True) for item in llm_request.contents]
+        )
+        if llm_request.config and llm_request.config.system_instruction:
+            prompt += str(llm_request.config.system_instruction)
+        output = json.dumps(content.model_dump(mode="json", exclude_none=True))
+
+        prompt_tokens, output_tokens = _estimate_tokens(prompt), _estimate_tokens(output)
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
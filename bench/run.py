@@ -0,0 +1,278 @@
+"""
+Offline benchmark for /api/agent_chat and /api/register.
+
+Runs the Flask app in-process with a scripted fake LLM (bench/fake_llm.py),
+the fixture question sheet and a local Supabase stand-in
+(bench/supabase_stub.py), so no Gemini quota, Sheets or Supabase access is
+needed. Full onboarding conversations and form registrations are driven
+concurrently and latency percentiles, turns and LLM calls per registration
+and registrations per second are reported.
+
+Usage, from the repository root:
+
+    python -m bench.run --conversations 100 --concurrency 20 --llm-latency-ms 300
+
+Every setting the app reads from the environment can still be overridden;
+the benchmark only provides offline defaults (see OFFLINE_ENV).
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from bench.supabase_stub import SupabaseStub  # noqa: E402
+
+_workdir = tempfile.mkdtemp(prefix="onboarding-bench-")
+OFFLINE_ENV = {
+    "QUESTION_SHEET_SOURCE": "fixture",
+    "QUESTION_SHEET_FIXTURE_PATH": os.path.join(ROOT, "fixtures", "questions_sheet.json"),
+    "QUESTION_SNAPSHOT_PATH": os.path.join(_workdir, "question_schema_snapshot.json"),
+    "SESSION_BACKEND": "sqlite",
+    "SESSION_SQLITE_PATH": os.path.join(_workdir, "agent_sessions.sqlite3"),
+    "REGISTRATION_QUEUE_PATH": os.path.join(_workdir, "registration_queue.sqlite3"),
+    "AGENT_WARMUP": "lazy",
+    "PREWARM_FIRST_TURN": "False",
+    # Keeps the question marker the conversation driver follows in fast-path replies
+    "FAST_PATH_REPLY_TEMPLATE": "Got it, {value}! {question} [ask:{entity}]",
+    "GOOGLE_API_KEY": "offline-benchmark",
+    "SUPABASE_SERVICE_ROLE_KEY": "offline-benchmark",
+    "SECRET_KEY": "offline-benchmark",
+}
+
+ASK_MARKER_RE = re.compile(r"\[ask:([\w-]+)\]")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (0 for no values)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(seconds),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 1),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 1),
+        "p99_ms": round(percentile(seconds, 99) * 1000, 1),
+        "max_ms": round(max(seconds, default=0.0) * 1000, 1),
+    }
+
+
+def build_profile(questions: List[Dict[str, Any]], number: int) -> Dict[str, str]:
+    """Valid answers for every question, unique per conversation."""
+    from custom_funcs.validation import get_validator
+
+    validator = get_validator(questions)
+    profile = {}
+    for entity, rule in validator.rules.items():
+        if rule.field_type == "email":
+            value = f"bench.user{number}@example.com"
+        elif rule.field_type in ("integer", "number"):
+            value = str(20 + number % 50)
+        elif rule.allowed_values:
+            value = sorted(rule.allowed_values)[0]
+        else:
+            value = f"bench_{number}"
+            if rule.min_length is not None and len(value) < rule.min_length:
+                value = value.ljust(rule.min_length, "x")
+            if rule.max_length is not None:
+                value = value[: rule.max_length]
+        profile[entity] = value
+
+    errors = validator.field_errors(profile)
+    if errors:
+        raise ValueError(f"Generated profile does not pass validation: {errors}")
+    return profile
+
+
+class ConversationResult:
+    def __init__(self):
+        self.completed = False
+        self.turns = 0
+        self.turn_seconds: List[float] = []
+        self.duration = 0.0
+        self.error: Optional[str] = None
+
+
+def run_conversation(flask_app, questions, number: int, max_turns: int) -> ConversationResult:
+    """Drive one onboarding conversation through /api/agent_chat until registration."""
+    result = ConversationResult()
+    profile = build_profile(questions, number)
+    client = flask_app.test_client()
+    started = time.perf_counter()
+
+    client.get("/")
+    message = "Hi, I'd like to sign up"
+    while result.turns < max_turns:
+        turn_started = time.perf_counter()
+        response = client.post("/api/agent_chat", json={"message": message})
+        result.turn_seconds.append(time.perf_counter() - turn_started)
+        result.turns += 1
+
+        body = response.get_json(silent=True) or {}
+        if response.status_code != 200 or not body.get("success"):
+            result.error = f"HTTP {response.status_code}: {body.get('error')}"
+            break
+
+        reply = " ".join(body.get("response") or [])
+        if "[registered]" in reply:
+            result.completed = True
+            break
+        asked = ASK_MARKER_RE.findall(reply)
+        if not asked:
+            result.error = f"Unexpected reply: {reply[:200]}"
+            break
+        message = profile.get(asked[-1], "skip")
+    else:
+        result.error = f"Not registered after {max_turns} turns"
+
+    result.duration = time.perf_counter() - started
+    return result
+
+
+def run_concurrently(task: Callable[[int], Any], count: int, concurrency: int):
+    """Run task(0..count-1) on `concurrency` threads; return (results, wall seconds)."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench-client") as executor:
+        results = list(executor.map(task, range(count)))
+    return results, time.perf_counter() - started
+
+
+def bench_chat(flask_app, questions, llm, args) -> Dict[str, Any]:
+    llm_calls_before = llm.calls
+    results, elapsed = run_concurrently(
+        lambda number: run_conversation(flask_app, questions, number, args.max_turns),
+        args.conversations,
+        args.concurrency,
+    )
+
+    completed = [result for result in results if result.completed]
+    turn_seconds = [seconds for result in results for seconds in result.turn_seconds]
+    llm_calls = llm.calls - llm_calls_before
+    errors = sorted({result.error for result in results if result.error})
+
+    return {
+        "conversations": len(results),
+        "registered": len(completed),
+        "failed": len(results) - len(completed),
+        "wall_seconds": round(elapsed, 3),
+        "registrations_per_second": round(len(completed) / elapsed, 2) if elapsed > 0 else 0.0,
+        "turn_latency": latency_summary(turn_seconds),
+        "conversation_latency": latency_summary([result.duration for result in completed]),
+        "turns_per_registration": round(sum(result.turns for result in completed) / len(completed), 2)
+        if completed else 0.0,
+        # Includes LLM calls of failed conversations and of events compaction
+        "llm_calls_per_registration": round(llm_calls / len(completed), 2) if completed else 0.0,
+        "llm_calls": llm_calls,
+        "errors": errors[:10],
+    }
+
+
+def bench_form(flask_app, questions, args) -> Dict[str, Any]:
+    client_local = threading.local()
+
+    def register(number: int):
+        client = getattr(client_local, "client", None)
+        if client is None:
+            client = client_local.client = flask_app.test_client()
+        payload = build_profile(questions, 1_000_000 + number)
+        started = time.perf_counter()
+        response = client.post("/api/register", json=payload)
+        return response.status_code, time.perf_counter() - started
+
+    results, elapsed = run_concurrently(register, args.registrations, args.form_concurrency)
+    succeeded = [seconds for status, seconds in results if status in (200, 202)]
+    return {
+        "requests": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "wall_seconds": round(elapsed, 3),
+        "registrations_per_second": round(len(succeeded) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency": latency_summary([seconds for _, seconds in results]),
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scenario", choices=["chat", "form", "all"], default="all")
+    parser.add_argument("--conversations", type=int, default=50, help="onboarding conversations to run")
+    parser.add_argument("--concurrency", type=int, default=10, help="conversations in flight at once")
+    parser.add_argument("--max-turns", type=int, default=20, help="turns before a conversation counts as failed")
+    parser.add_argument("--registrations", type=int, default=200, help="form registrations to submit")
+    parser.add_argument("--form-concurrency", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated model latency per call")
+    parser.add_argument("--llm-jitter-ms", type=float, default=0.0, help="random extra latency per call")
+    parser.add_argument("--supabase-latency-ms", type=float, default=20.0)
+    parser.add_argument("--output", help="also write the report as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's INFO logs")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    stub = SupabaseStub(latency_seconds=args.supabase_latency_ms / 1000).start()
+    os.environ.setdefault("SUPABASE_ONBOARD_USER_URL", stub.url)
+    for name, value in OFFLINE_ENV.items():
+        os.environ.setdefault(name, value)
+
+    # Imported only now, so the app reads the offline settings above
+    import app as flask_app_module
+    from custom_funcs.agents.agent_singleton import STARTUP_TIMINGS, _get_agent, override_model
+    from custom_funcs.question_cache import question_cache
+
+    # Build the ADK stack before fake_llm imports google.adk, so the import is timed
+    _get_agent()
+    from bench.fake_llm import ScriptedLlm
+
+    questions = question_cache.get_questions()
+    if not questions:
+        raise SystemExit("No questions loaded; check QUESTION_SHEET_FIXTURE_PATH")
+
+    llm = ScriptedLlm(
+        latency_seconds=args.llm_latency_ms / 1000, jitter_seconds=args.llm_jitter_ms / 1000
+    )
+    override_model(llm)
+    flask_app = flask_app_module.app
+
+    report: Dict[str, Any] = {
+        "settings": {
+            key: value for key, value in vars(args).items() if key not in ("output", "verbose")
+        },
+        "session_backend": os.environ.get("SESSION_BACKEND"),
+        "startup_seconds": {name: round(value, 3) for name, value in STARTUP_TIMINGS.items()},
+    }
+    if args.scenario in ("chat", "all"):
+        report["chat"] = bench_chat(flask_app, questions, llm, args)
+    if args.scenario in ("form", "all"):
+        report["form"] = bench_form(flask_app, questions, args)
+    report["supabase_stub"] = stub.stats()
+    stub.stop()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(text + "\n")
+    return report
+
+
+if __name__ == "__main__":
+    main()
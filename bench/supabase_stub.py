@@ -0,0 +1,75 @@
+"""
+Local stand-in for the Supabase `create-user` edge function.
+
+Answers every POST with 200 and a small JSON body after a configurable
+latency, and counts the requests and distinct idempotency keys it saw.
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Set
+from uuid import uuid4
+
+
+class SupabaseStub:
+    """Threaded HTTP server on 127.0.0.1 mimicking the create-user function."""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.idempotency_keys: Set[str] = set()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real edge function behind its gateway
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                stub._record(self.headers.get("Idempotency-Key"))
+                if stub.latency_seconds > 0:
+                    time.sleep(stub.latency_seconds)
+
+                body = json.dumps({"id": str(uuid4()), "email": payload.get("email")}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="supabase-stub", daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/functions/v1/create-user"
+
+    def _record(self, idempotency_key: str) -> None:
+        with self._lock:
+            self.requests += 1
+            if idempotency_key:
+                self.idempotency_keys.add(idempotency_key)
+
+    def start(self) -> "SupabaseStub":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"requests": self.requests, "idempotency_keys": len(self.idempotency_keys)}
@@ -26,4 +26,112 @@ class Config:
     
     # 2. DEBUG: Casts the env var string 'False'/'0' to a boolean
     # If FLASK_DEBUG is missing, it defaults to False (Production safe)
-    DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() in ['true', '1']
\ No newline at end of file
+    DEBUG = os.environ.get('FLASK_DEBUG', 'False').lower() in ['true', '1']
+
+# Question schema cache (admin panel / Google Sheet)
+# How long a fetched question schema is considered fresh, in seconds
+QUESTION_CACHE_TTL_SECONDS = float(os.environ.get('QUESTION_CACHE_TTL_SECONDS', '300'))
+# How long to wait before retrying after a failed fetch, in seconds
+QUESTION_CACHE_ERROR_RETRY_SECONDS = float(os.environ.get('QUESTION_CACHE_ERROR_RETRY_SECONDS', '10'))
+# Number of past schema versions kept so sessions can validate against the version they saw
+QUESTION_SCHEMA_VERSIONS_KEPT = int(os.environ.get('QUESTION_SCHEMA_VERSIONS_KEPT', '16'))
+# Last good schema persisted for fast cold starts and Sheets outages; empty disables it
+QUESTION_SNAPSHOT_PATH = os.environ.get('QUESTION_SNAPSHOT_PATH', 'question_schema_snapshot.json')
+
+# Where the agent tools get the question schema from:
+# 'local' reads the in-process cache, 'http' calls QUESTION_SCHEMA_API_URL/retrieve_all_questions
+QUESTION_SCHEMA_PROVIDER = os.environ.get('QUESTION_SCHEMA_PROVIDER', 'local').lower()
+QUESTION_SCHEMA_API_URL = os.environ.get('QUESTION_SCHEMA_API_URL', 'http://127.0.0.1:5000')
+
+# Agent sessions
+# Number of chat session ids remembered as already existing in the session store
+KNOWN_SESSION_CACHE_SIZE = int(os.environ.get('KNOWN_SESSION_CACHE_SIZE', '10000'))
+
+# Events compaction: summarize older conversation events so each turn's prompt stays bounded
+EVENTS_COMPACTION_ENABLED = os.environ.get('EVENTS_COMPACTION_ENABLED', 'True').lower() in ['true', '1']
+# Number of new user turns that triggers a compaction
+EVENTS_COMPACTION_INTERVAL = int(os.environ.get('EVENTS_COMPACTION_INTERVAL', '3'))
+# Number of preceding turns repeated in the next compacted window for continuity
+EVENTS_COMPACTION_OVERLAP = int(os.environ.get('EVENTS_COMPACTION_OVERLAP', '1'))
+# Model used to write the summaries; empty means the agent's own model
+EVENTS_COMPACTION_MODEL = os.environ.get('EVENTS_COMPACTION_MODEL', 'gemini-2.5-flash-lite')
+
+# Model tiering: simple turns use the fast model, complex ones escalate to the pro model
+MODEL_ROUTING_ENABLED = os.environ.get('MODEL_ROUTING_ENABLED', 'True').lower() in ['true', '1']
+FAST_MODEL_NAME = os.environ.get('FAST_MODEL_NAME', 'gemini-2.5-flash-lite')
+PRO_MODEL_NAME = os.environ.get('PRO_MODEL_NAME', 'gemini-2.5-pro')
+# Messages longer than this many words are treated as complex
+MODEL_ROUTING_MAX_SIMPLE_WORDS = int(os.environ.get('MODEL_ROUTING_MAX_SIMPLE_WORDS', '25'))
+
+# Fast path: a reply that is exactly a valid answer to the question asked last is saved
+# without a model call when the question's rule is strict (email, number, enum or regex)
+FAST_PATH_ENABLED = os.environ.get('FAST_PATH_ENABLED', 'True').lower() in ['true', '1']
+# Reply sent instead of the model's; fields: {value} (saved answer), {question}, {entity} (next question)
+FAST_PATH_REPLY_TEMPLATE = os.environ.get('FAST_PATH_REPLY_TEMPLATE', 'Got it, {value}! {question}')
+
+# Pre-warming: generate the agent's opening question in the background when the page loads
+PREWARM_FIRST_TURN = os.environ.get('PREWARM_FIRST_TURN', 'False').lower() in ['true', '1']
+# How long the page waits for the pre-generated opening question, in seconds
+PREWARM_OPENING_TIMEOUT_SECONDS = float(os.environ.get('PREWARM_OPENING_TIMEOUT_SECONDS', '20'))
+
+# Admission control for agent turns: running turns, turns waiting for a slot, and the
+# per-turn deadline (queue wait included) after which a turn is cancelled
+AGENT_MAX_CONCURRENT_TURNS = int(os.environ.get('AGENT_MAX_CONCURRENT_TURNS', '32'))
+AGENT_MAX_QUEUED_TURNS = int(os.environ.get('AGENT_MAX_QUEUED_TURNS', '64'))
+AGENT_TURN_TIMEOUT_SECONDS = float(os.environ.get('AGENT_TURN_TIMEOUT_SECONDS', '60'))
+# Retry-After hint sent with 503 responses when the queue is full, in seconds
+AGENT_RETRY_AFTER_SECONDS = int(os.environ.get('AGENT_RETRY_AFTER_SECONDS', '5'))
+
+# Fallback to the form view: over a rolling window, new visitors get the form first when
+# agent turns are too slow (p95) or fail too often, given enough turns to judge
+AGENT_FALLBACK_ENABLED = os.environ.get('AGENT_FALLBACK_ENABLED', 'True').lower() in ['true', '1']
+AGENT_HEALTH_WINDOW_SECONDS = float(os.environ.get('AGENT_HEALTH_WINDOW_SECONDS', '120'))
+AGENT_HEALTH_MIN_SAMPLES = int(os.environ.get('AGENT_HEALTH_MIN_SAMPLES', '10'))
+AGENT_DEGRADED_P95_SECONDS = float(os.environ.get('AGENT_DEGRADED_P95_SECONDS', '20'))
+AGENT_DEGRADED_ERROR_RATE = float(os.environ.get('AGENT_DEGRADED_ERROR_RATE', '0.25'))
+
+# ADK stack startup: 'background' builds the runner in a thread at app start, 'lazy' on the
+# first chat turn (page views before that only remember the question schema for the session)
+AGENT_WARMUP = os.environ.get('AGENT_WARMUP', 'background').lower()
+
+# Agent session storage: 'database' (Postgres at SUPABASE_ONBOARDING_AGENT_MEMORY_DB_URL),
+# 'sqlite' (local WAL file, for offline runs) or 'memory'
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'database').lower()
+# Connection pool of the database backends; session reads/writes run on pool_size + max_overflow
+# threads, so together they bound the session store operations in flight
+SESSION_DB_POOL_SIZE = int(os.environ.get('SESSION_DB_POOL_SIZE', '10'))
+SESSION_DB_MAX_OVERFLOW = int(os.environ.get('SESSION_DB_MAX_OVERFLOW', '10'))
+SESSION_DB_POOL_PRE_PING = os.environ.get('SESSION_DB_POOL_PRE_PING', 'True').lower() in ['true', '1']
+# Recycle connections before the server or a pooler drops idle ones, in seconds
+SESSION_DB_POOL_RECYCLE_SECONDS = int(os.environ.get('SESSION_DB_POOL_RECYCLE_SECONDS', '1800'))
+SESSION_SQLITE_PATH = os.environ.get('SESSION_SQLITE_PATH', 'agent_sessions.sqlite3')
+
+# Supabase edge function HTTP client
+# Max keep-alive connections kept open to the edge function
+SUPABASE_POOL_SIZE = int(os.environ.get('SUPABASE_POOL_SIZE', '10'))
+# Retries on connection errors and 429/503 responses; backoff grows exponentially with jitter
+SUPABASE_MAX_RETRIES = int(os.environ.get('SUPABASE_MAX_RETRIES', '3'))
+SUPABASE_RETRY_BACKOFF_SECONDS = float(os.environ.get('SUPABASE_RETRY_BACKOFF_SECONDS', '0.5'))
+
+# Write-behind registration queue (SQLite file flushed to Supabase by worker threads)
+REGISTRATION_QUEUE_ENABLED = os.environ.get('REGISTRATION_QUEUE_ENABLED', 'False').lower() in ['true', '1']
+REGISTRATION_QUEUE_PATH = os.environ.get('REGISTRATION_QUEUE_PATH', 'registration_queue.sqlite3')
+REGISTRATION_QUEUE_WORKERS = int(os.environ.get('REGISTRATION_QUEUE_WORKERS', '4'))
+# Registrations claimed per dispatch round
+REGISTRATION_QUEUE_BATCH_SIZE = int(os.environ.get('REGISTRATION_QUEUE_BATCH_SIZE', '20'))
+REGISTRATION_QUEUE_MAX_ATTEMPTS = int(os.environ.get('REGISTRATION_QUEUE_MAX_ATTEMPTS', '5'))
+# Idle polling interval, also the per-attempt retry delay, in seconds
+REGISTRATION_QUEUE_POLL_SECONDS = float(os.environ.get('REGISTRATION_QUEUE_POLL_SECONDS', '1'))
+
+# Bulk registration import
+# Valid rows forwarded together; a batch is sent concurrently before the next one is read
+BULK_IMPORT_BATCH_SIZE = int(os.environ.get('BULK_IMPORT_BATCH_SIZE', '50'))
+BULK_IMPORT_CONCURRENCY = int(os.environ.get('BULK_IMPORT_CONCURRENCY', '8'))
+# Per-row errors included in the response; the counts always cover every row
+BULK_IMPORT_MAX_REPORTED_ERRORS = int(os.environ.get('BULK_IMPORT_MAX_REPORTED_ERRORS', '1000'))
+# Bearer token callers of /api/register/bulk must send; the endpoint is disabled while unset
+BULK_IMPORT_TOKEN = os.environ.get('BULK_IMPORT_TOKEN', '')
+
+# Question sheet source: 'google' (Sheets API) or 'fixture' (local JSON file, for offline runs)
+QUESTION_SHEET_SOURCE = os.environ.get('QUESTION_SHEET_SOURCE', 'google').lower()
+QUESTION_SHEET_FIXTURE_PATH = os.environ.get('QUESTION_SHEET_FIXTURE_PATH', 'fixtures/questions_sheet.json')
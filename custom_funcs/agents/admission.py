@@ -0,0 +1,154 @@
+"""Admission control for agent turns.
+
+At most AGENT_MAX_CONCURRENT_TURNS turns run on the agent loop at once and at
+most AGENT_MAX_QUEUED_TURNS more wait for a slot. Beyond that, new turns are
+rejected right away with `AgentOverloadedError`, which carries a Retry-After
+hint, instead of piling up behind a degraded Gemini.
+
+Every admitted turn has a deadline of AGENT_TURN_TIMEOUT_SECONDS, queue wait
+included. When it passes, the turn's task is cancelled, which stops the
+`runner.run_async` iteration along with any model retries still pending, and
+`AgentTurnTimeoutError` is raised.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Coroutine, Optional
+
+from config import (
+    AGENT_MAX_CONCURRENT_TURNS,
+    AGENT_MAX_QUEUED_TURNS,
+    AGENT_TURN_TIMEOUT_SECONDS,
+    AGENT_RETRY_AFTER_SECONDS,
+)
+from custom_funcs.metrics import Counter, Histogram, register_collector
+from .health import agent_health
+
+logger = logging.getLogger(__name__)
+
+TURNS_REJECTED = Counter("agent_turns_rejected_total", "Agent turns refused or cut off", ["reason"])
+QUEUE_WAIT_SECONDS = Histogram("agent_turn_queue_wait_seconds", "Time agent turns waited for a slot")
+
+
+class AgentOverloadedError(Exception):
+    """Raised when the agent is at capacity; retry after `retry_after` seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("The assistant is busy right now, please try again in a moment.")
+        self.retry_after = retry_after
+
+
+class AgentTurnTimeoutError(Exception):
+    """Raised when a turn did not finish before its deadline."""
+
+    def __init__(self, timeout: float):
+        super().__init__(f"The assistant took longer than {timeout:g} seconds to respond, please try again.")
+        self.timeout = timeout
+
+
+class TurnAdmission:
+    """Bounded concurrency plus a bounded wait queue in front of the agent loop."""
+
+    def __init__(
+        self,
+        max_concurrent: int = AGENT_MAX_CONCURRENT_TURNS,
+        max_queued: int = AGENT_MAX_QUEUED_TURNS,
+        turn_timeout: float = AGENT_TURN_TIMEOUT_SECONDS,
+        retry_after: float = AGENT_RETRY_AFTER_SECONDS,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.turn_timeout = turn_timeout
+        self.retry_after = retry_after
+
+        # Admitted = running + waiting; counted from the submitting threads
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        # Created on first use, on the agent loop
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def submit(
+        self, coro: Coroutine[Any, Any, Any], loop: asyncio.AbstractEventLoop
+    ) -> concurrent.futures.Future:
+        """Admit a turn and schedule it on `loop`.
+
+        Raises AgentOverloadedError without scheduling anything when the wait
+        queue is full.
+        """
+        with self._lock:
+            if self._admitted >= self.max_concurrent + self.max_queued:
+                coro.close()
+                TURNS_REJECTED.inc(reason="overloaded")
+                agent_health.record(0.0, ok=False)
+                raise AgentOverloadedError(self.retry_after)
+            self._admitted += 1
+
+        future = asyncio.run_coroutine_threadsafe(self._run(coro), loop)
+        # Runs on completion and on cancellation, even before the task started
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._admitted -= 1
+
+    async def _run(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            result = await asyncio.wait_for(self._run_in_slot(coro), self.turn_timeout)
+        except asyncio.TimeoutError:
+            TURNS_REJECTED.inc(reason="timeout")
+            agent_health.record(loop.time() - started, ok=False)
+            logger.warning("Agent turn cancelled after %g s", self.turn_timeout)
+            raise AgentTurnTimeoutError(self.turn_timeout) from None
+        except Exception:
+            agent_health.record(loop.time() - started, ok=False)
+            raise
+        agent_health.record(loop.time() - started, ok=True)
+        return result
+
+    async def _run_in_slot(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent)
+
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        try:
+            await self._slots.acquire()
+        except BaseException:
+            # Timed out or cancelled while queued: the turn never starts
+            coro.close()
+            raise
+        QUEUE_WAIT_SECONDS.observe(loop.time() - queued_at)
+
+        self._running += 1
+        try:
+            return await coro
+        finally:
+            self._running -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            admitted = self._admitted
+        running = self._running
+        return {"running": running, "queued": max(admitted - running, 0)}
+
+
+turn_admission = TurnAdmission()
+
+
+def _collect_admission_stats():
+    stats = turn_admission.stats()
+    yield (
+        "agent_turns_in_flight",
+        "gauge",
+        "Agent turns currently running or waiting for a slot",
+        [({"state": state}, value) for state, value in sorted(stats.items())],
+    )
+
+
+register_collector(_collect_admission_stats)
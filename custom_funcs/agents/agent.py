@@ -1,4 +1,4 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
 
 
 import os
@@ -6,14 +6,28 @@ import asyncio
 import json
 import sys
 
-import requests
+from config import (
+    EVENTS_COMPACTION_ENABLED,
+    EVENTS_COMPACTION_INTERVAL,
+    EVENTS_COMPACTION_OVERLAP,
+    EVENTS_COMPACTION_MODEL,
+    PRO_MODEL_NAME,
+    REGISTRATION_QUEUE_ENABLED,
+)
+from custom_funcs.agents.fast_path import remember_open_question
+from custom_funcs.agents.model_router import route_model
+from custom_funcs.agents.session_backend import build_session_service
+from custom_funcs.agents.telemetry import after_tool, before_tool, on_tool_error
+from custom_funcs.schema_provider import get_schema_provider
 from custom_funcs.supabase_client import create_user
+from custom_funcs.registration_queue import SUCCEEDED, get_registration_queue
+from custom_funcs.validation import get_validator
 from dotenv import load_dotenv
 from google.adk.agents import Agent, LlmAgent
 from google.adk.apps.app import App, EventsCompactionConfig
+from google.adk.apps.llm_event_summarizer import LlmEventSummarizer
 from google.adk.models.google_llm import Gemini
 from google.adk.runners import Runner
-from google.adk.sessions import DatabaseSessionService, InMemorySessionService
 from google.adk.tools.tool_context import ToolContext
 from google.genai import types
 
@@ -38,83 +52,179 @@ retry_config = types.HttpRetryOptions(
 ## Tool Context
 # Define scope levels for state keys (following best practices)
 USER_NAME_SCOPE_LEVELS = ("temp", "user", "app")
+# Priority given to questions without a valid numeric `question_order_priority`
+MISSING_PRIORITY = 999
+# Optional sheet columns with answer constraints, see custom_funcs/validation.py
+FIELD_CONSTRAINT_KEYS = ("field_type", "validation_regex", "allowed_values", "min_length", "max_length")
+# Session-scoped key holding the entity the model was told to ask next (see fast_path.py)
+ASKED_ENTITY_KEY = "asked_entity"
 # This demonstrates how tools can write to session state using tool_context.
 # The 'user:' prefix indicates this is user-specific data.
 
-def save_user_info(
+async def save_user_info(
     tool_context: ToolContext, data: Dict[str, Any]
 ) -> Dict[str, Any]:
     """
     Save one or multiple user attributes to the session state.
 
+    Values are checked against the field constraints from the question sheet;
+    invalid values are not saved and are reported under 'errors' so the user can
+    be asked again.
+
     Args:
         data: A dictionary of key-value pairs to save (e.g., {"name": "John", "age": 30})
     """
+    errors = await _field_errors(data)
+
     saved_items = {}
     for key, value in data.items():
+        if key in errors:
+            continue
         # Enforce the 'user:' prefix convention
         full_key = f"user:{key}"
         tool_context.state[full_key] = value
         saved_items[key] = value
 
+    if errors:
+        return {"status": "error", "saved": saved_items, "errors": errors}
     return {"status": "success", "saved": saved_items}
 
 
+async def _fetch_questions() -> List[Dict[str, Any]]:
+    """Question schema from the provider, fetched off the event loop (it may do network I/O)."""
+    return await asyncio.to_thread(get_schema_provider().get_questions)
 
 
+async def _field_errors(data: Dict[str, Any]) -> Dict[str, str]:
+    """Validate answers with the same compiled validator the registration endpoint uses."""
+    try:
+        questions = await _fetch_questions()
+    except Exception:
+        # Without a schema there is nothing to validate against; registration re-checks later
+        return {}
+    return get_validator(questions).field_errors(data)
 
 
 
-def load_question_schema_from_api(tool_context: ToolContext) -> Dict[str, Any]:
-    """Fetch onboarding questions from the Flask API and store them in session state.
 
-    Calls GET /retrieve_all_questions and saves the 'questions' list to
-    tool_context.state["app:question_schema"].
-    """
-    try:
-        FLASK_BASE_URL = "http://127.0.0.1:5000"        
-        resp = requests.get(f"{FLASK_BASE_URL}/retrieve_all_questions", timeout=5)
-        resp.raise_for_status()
-        data = resp.json()
-        # print(data)
-    except Exception as exc:
-        return {"status": "error", "message": f"Failed to fetch questions: {exc}"}
 
-    if not data.get("success"):
-        return {"status": "error", "message": data.get("error", "Unknown error")}
 
-    questions = data.get("questions", [])
 
-    # Filter questions: mandatory='Y', active='Y', and keep specific keys
+def build_question_schema(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Reduce raw sheet questions to the schema the tools keep in session state."""
+    # Filter questions: active='Y', and keep specific keys
     filtered_questions = [
         {
             "questioned_entity": q.get("questioned_entity"),
             "question_phrasing_example": q.get("question_phrasing_example"),
-            "question_order_priority": q.get("question_order_priority"),
-            "is_mandatory": q.get("is_mandatory"),
+            "question_order_priority": _priority_value(q.get("question_order_priority")),
+            "is_mandatory": (q.get("is_mandatory") or "").upper(),
+            # Answer constraints, so checks on the event loop need no provider call (fast_path.py)
+            **{key: q.get(key) for key in FIELD_CONSTRAINT_KEYS if q.get(key)},
         }
         for q in questions
         if q.get("is_active") == "Y"
     ]
+    # Store the schema in asking order once (mandatory first, then lower priority
+    # number) so the status tools never have to sort again
+    filtered_questions.sort(
+        key=lambda item: (item["is_mandatory"] != "Y", item["question_order_priority"])
+    )
+    return filtered_questions
 
-    tool_context.state["app:question_schema"] = filtered_questions
-    return tool_context.state["app:question_schema"]
 
+async def load_question_schema_from_api(tool_context: ToolContext) -> Dict[str, Any]:
+    """Load onboarding questions from the schema provider and store them in session state.
 
-def get_onboarding_status(tool_context: ToolContext) -> Dict[str, Any]:
+    The provider is in-process by default (shared question cache), so no HTTP
+    round trip is made. The 'questions' list is saved to
+    tool_context.state["app:question_schema"].
+    """
+    try:
+        questions = await _fetch_questions()
+    except Exception as exc:
+        return {"status": "error", "message": f"Failed to fetch questions: {exc}"}
+
+    tool_context.state["app:question_schema"] = build_question_schema(questions)
+    # The questions themselves reach the model through the status tools, only pending ones
+    return {"status": "success", "questions_loaded": len(tool_context.state["app:question_schema"])}
+
+
+async def _ensure_question_schema(tool_context: ToolContext) -> None:
+    """Load the schema on demand if the session wasn't seeded with it."""
+    if not tool_context.state.get("app:question_schema"):
+        await load_question_schema_from_api(tool_context)
+
+
+def _priority_value(priority: Any) -> int:
+    """Numeric priority for `question_order_priority`; missing/invalid values go last."""
+    try:
+        return int(priority)
+    except (TypeError, ValueError):
+        return MISSING_PRIORITY
+
+
+async def _pending_questions(tool_context: ToolContext) -> Tuple[List[Dict[str, Any]], int]:
+    """Return (pending questions in asking order, number of completed questions)."""
+    await _ensure_question_schema(tool_context)
+    schema = tool_context.state.get("app:question_schema", [])
+    pending = [
+        {
+            "entity": item.get("questioned_entity"),
+            "question_example": item.get("question_phrasing_example"),
+            "is_mandatory": item.get("is_mandatory"),
+        }
+        for item in schema
+        if not tool_context.state.get(f"user:{item.get('questioned_entity')}")
+    ]
+    return pending, len(schema) - len(pending)
+
+
+def _remember_asked_entity(
+    tool_context: ToolContext, pending: List[Dict[str, Any]], errors: Dict[str, str]
+) -> None:
+    """Record which question the model asks next: a rejected answer first, else the first pending one."""
+    if errors:
+        asked = next(iter(errors))
+    else:
+        asked = pending[0]["entity"] if pending else None
+    if tool_context.state.get(ASKED_ENTITY_KEY) != asked:
+        tool_context.state[ASKED_ENTITY_KEY] = asked
+    # In-process copy, so the fast path only reads the session for likely answers
+    remember_open_question(
+        tool_context.session.id, asked, tool_context.state.get("app:question_schema")
+    )
+
+
+async def get_onboarding_status(tool_context: ToolContext, detailed: bool = False) -> Dict[str, Any]:
     """
     Check which onboarding questions have been answered and which are pending.
 
+    Args:
+        detailed: False (default) returns only the pending questions and a completed count.
+            True returns every question with its status and current saved value.
+
     Returns:
-        A list of questions. Each item includes:
+        Compact mode:
+        - 'pending': Unanswered questions in asking order, each with 'entity',
+          'question_example' and 'is_mandatory'.
+        - 'completed_count': Number of questions already answered.
+        Detailed mode, 'onboarding_status': A list of questions. Each item includes:
         - 'entity': The data field (e.g., 'name')
         - 'question': Example phrasing
         - 'status': 'COMPLETED' if we have the data, 'PENDING' if not.
         - 'value': The current saved value (if any).
     """
+    if not detailed:
+        pending, completed_count = await _pending_questions(tool_context)
+        _remember_asked_entity(tool_context, pending, {})
+        return {"pending": pending, "completed_count": completed_count}
+
+    await _ensure_question_schema(tool_context)
     schema = tool_context.state.get("app:question_schema", [])
     status_report = []
 
+    # The schema is already stored in asking order (see load_question_schema_from_api)
     for item in schema:
         entity_key = item.get("questioned_entity")
         # Check if this entity exists in the user state
@@ -134,19 +244,53 @@ def get_onboarding_status(tool_context: ToolContext) -> Dict[str, Any]:
             }
         )
 
-    # Sort by priority so the agent knows what to ask next naturally
-    # Assuming lower number = higher priority
-    status_report.sort(key=lambda x: x["priority"] or 999)
-
     return {"onboarding_status": status_report}
 
 
-def register_user_in_db(tool_context: ToolContext) -> Dict[str, Any]:
+async def save_answers_and_get_next(
+    tool_context: ToolContext, data: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Save the user's answers and return what is still missing, in one call.
+
+    Args:
+        data: A dictionary of entity-value pairs to save (e.g., {"name": "John", "email": "john@x.com"}).
+            Keys must match the 'questioned_entity' fields of the question schema. Pass {} to only
+            get the pending questions.
+
+    Returns:
+        - 'saved': The saved entity-value pairs.
+        - 'errors': Only present if some answers were invalid; maps entity to the reason.
+          Those answers were not saved.
+        - 'pending': Still unanswered questions in the order they should be asked
+          (mandatory first, then by priority). Each item has 'entity', 'question_example'
+          and 'is_mandatory'.
+        - 'completed_count': Number of questions already answered.
+        - 'all_mandatory_completed': True when registration can be submitted.
+    """
+    save_result = await save_user_info(tool_context, data)
+    pending, completed_count = await _pending_questions(tool_context)
+    _remember_asked_entity(tool_context, pending, save_result.get("errors", {}))
+
+    result = {
+        "status": save_result["status"],
+        "saved": save_result["saved"],
+        "pending": pending,
+        "completed_count": completed_count,
+        "all_mandatory_completed": not any(item["is_mandatory"] == "Y" for item in pending),
+    }
+    if "errors" in save_result:
+        result["errors"] = save_result["errors"]
+    return result
+
+
+async def register_user_in_db(tool_context: ToolContext) -> Dict[str, Any]:
     """
     Registers the user in the database using the collected onboarding information.
     Call this tool ONLY after all mandatory questions are answered and the user is ready to be registered.
     """
     # Retrieve the schema to know which keys to look for
+    await _ensure_question_schema(tool_context)
     schema = tool_context.state.get("app:question_schema", [])
     
     user_data = {}
@@ -160,8 +304,31 @@ def register_user_in_db(tool_context: ToolContext) -> Dict[str, Any]:
             if value is not None:
                 user_data[entity_key] = value
 
-    # Call the imported create_user function
-    result = create_user(user_data)
+    # Same checks as the form endpoint, against the questions this session asked; the
+    # schema carries the sheet's constraints, so no I/O here
+    if not schema:
+        return {"success": False, "error": "No onboarding questions are loaded", "status_code": 503}
+    is_valid, error_msg = get_validator(schema).validate(user_data)
+    if not is_valid:
+        return {"success": False, "error": error_msg, "status_code": 400}
+
+    # One registration per chat session, however often the model retries this tool
+    idempotency_key = f"agent:{tool_context.session.id}"
+
+    if REGISTRATION_QUEUE_ENABLED and user_data:
+        # Don't hold the turn on the edge function; the queue delivers it in the background
+        # A retry after a failed registration re-queues it with the corrected answers
+        registration_id, status = await asyncio.to_thread(
+            get_registration_queue().enqueue, user_data, idempotency_key
+        )
+        return {
+            "success": True,
+            "status": "succeeded" if status == SUCCEEDED else "queued",
+            "registration_id": registration_id,
+        }
+
+    # Call the imported create_user function; it blocks on HTTP with retries, so off the event loop
+    result = await asyncio.to_thread(create_user, user_data, idempotency_key=idempotency_key)
 
     return result
 
@@ -170,8 +337,9 @@ def register_user_in_db(tool_context: ToolContext) -> Dict[str, Any]:
 APP_NAME = "agents"  # Application
 USER_ID = "new_user_getting_onboarded"  # User
 SESSION = "ephemeral-local-storage-id"  # Session
-# MODEL_NAME = "gemini-2.5-flash-lite"
-MODEL_NAME = "gemini-2.5-pro"
+# Default model; with MODEL_ROUTING_ENABLED simple turns are re-targeted to
+# FAST_MODEL_NAME by route_model (see model_router.py)
+MODEL_NAME = PRO_MODEL_NAME
 
 # Step 1: Create the LLM Agent
 root_agent = Agent(
@@ -197,20 +365,19 @@ root_agent = Agent(
         - Make the conversation about the user, don't mention yourself. Ask about them and inform them about their own process.
         
         Your goals:
-        1. **Initialization**: At the very start of the conversation, call `load_question_schema_from_api` once to load the questions from the backend.
-        2. **Check Status**: Before asking a question, ALWAYS call `get_onboarding_status` to see which questions are 'PENDING' and which are 'COMPLETED'.
-        3. **Ask Questions**: Select questions with 'PENDING' status, ask questions to have their status as 'COMPLETED'. First prioritize the questions that are mandatory, then with lower priority numbers.
-        4. **Save Answers**: When the user provides an answer, IMMEDIATELY call `save_user_info` to save the data. The key should match the 'entity' field from the status report.
-        5. **Loop**: After saving, call `get_onboarding_status` again to confirm the status is now 'COMPLETED' and find the next 'PENDING' question.
-        6. **Finalize**: Once all questions are answered, call `register_user_in_db` to save the user to the database.
-        7. **Finalize early**: If a user has answered all the mandatory questions and wants to register before answering the rest, accept this request, call `register_user_in_db` to save the user to the database.
-        8. **Status update**: Inform the user about the completed onboarding and finish the conversation.
+        1. **Initialization**: At the very start of the conversation, call `save_answers_and_get_next` with an empty `data` ({}) to get the first 'PENDING' question. The questions are already loaded for you.
+        2. **Save and Continue**: When the user provides one or more answers, call `save_answers_and_get_next` ONCE with all of them. The keys should match the 'entity' fields. It saves the answers and returns the remaining 'pending' questions in the order to ask them, so no other tool call is needed before asking the next question.
+        3. **Ask Questions**: If the result has 'errors', kindly tell the user what was wrong with that answer and ask for it again. Otherwise ask the first question from 'pending'. Mandatory questions already come first, then lower priority numbers.
+        4. **Finalize**: Once 'pending' is empty, call `register_user_in_db` to save the user to the database.
+        5. **Finalize early**: If 'all_mandatory_completed' is true and the user wants to register before answering the rest, accept this request, call `register_user_in_db` to save the user to the database.
+        6. **Status update**: Inform the user about the completed onboarding and finish the conversation.
 
 
         Tools:
-        - `load_question_schema_from_api`: Fetches questions from backend. Call once at start.
-        - `get_onboarding_status`: Returns the list of questions with their current status (PENDING/COMPLETED) and values.
-        - `save_user_info`: Saves the user's answers to the session state.
+        - `load_question_schema_from_api`: Reloads questions from backend. Only needed if the other tools report that no questions are loaded.
+        - `save_answers_and_get_next`: Saves the user's answers and returns the pending questions in order. Use this for every answer.
+        - `get_onboarding_status`: Returns the pending questions and a completed count. Pass `detailed=True` only if you must review the saved values.
+        - `save_user_info`: Saves the user's answers to the session state without returning the pending questions.
         - `register_user_in_db`: Submits the collected data to the database.
 
 
@@ -225,17 +392,48 @@ root_agent = Agent(
         
         - send joyful messages.
         """,
-    tools=[load_question_schema_from_api, get_onboarding_status, save_user_info, register_user_in_db],
+    before_model_callback=route_model,
+    # Time every tool call for the /metrics endpoint
+    before_tool_callback=before_tool,
+    after_tool_callback=after_tool,
+    on_tool_error_callback=on_tool_error,
+    tools=[
+        load_question_schema_from_api,
+        save_answers_and_get_next,
+        get_onboarding_status,
+        save_user_info,
+        register_user_in_db,
+    ],
 )
 ## there should be the state of if_asked for each question too.
 
-# Step 2: Set up session service (In-memory or Database)
-# InMemorySessionService stores conversations in RAM (temporary)
-# session_service = InMemorySessionService()
-
+# Step 2: Set up session service (Postgres, local SQLite or in-memory, see SESSION_BACKEND)
 SUPABASE_ONBOARDING_AGENT_MEMORY_DB_URL = os.getenv("SUPABASE_ONBOARDING_AGENT_MEMORY_DB_URL")
 db_url = SUPABASE_ONBOARDING_AGENT_MEMORY_DB_URL
-session_service = DatabaseSessionService(db_url=db_url)
+session_service = build_session_service(db_url)
+
+# Step 3: Wrap the agent in an App so events compaction keeps the prompt bounded.
+# Every EVENTS_COMPACTION_INTERVAL invocations the older events (tool calls and
+# results included) are summarized, keeping EVENTS_COMPACTION_OVERLAP
+# invocations of overlap so the next summary still has context.
+events_compaction_config = None
+if EVENTS_COMPACTION_ENABLED:
+    events_compaction_config = EventsCompactionConfig(
+        compaction_interval=EVENTS_COMPACTION_INTERVAL,
+        overlap_size=EVENTS_COMPACTION_OVERLAP,
+        # Summarizing is a plain text task; a cheaper model can be configured for it
+        summarizer=(
+            LlmEventSummarizer(llm=Gemini(model=EVENTS_COMPACTION_MODEL, retry_options=retry_config))
+            if EVENTS_COMPACTION_MODEL
+            else None
+        ),
+    )
+
+agent_app = App(
+    name=APP_NAME,
+    root_agent=root_agent,
+    events_compaction_config=events_compaction_config,
+)
 
-# Step 3: Create the Runner
-runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
\ No newline at end of file
+# Step 4: Create the Runner
+runner = Runner(app=agent_app, session_service=session_service)
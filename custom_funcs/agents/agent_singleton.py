@@ -1,20 +1,111 @@
 """Singleton access to the Google-ADK runner for the Flask app.
 
-This keeps a single `Runner` instance (with its `InMemorySessionService`) in
-memory for the lifetime of the Flask process so the short-lived in-memory
-conversation history is shared across HTTP requests.
+This keeps a single `Runner` instance (with its session service) in memory for
+the lifetime of the Flask process. Agent turns run on one event loop that lives
+in a dedicated background thread, so Flask worker threads only submit work to
+it and many conversations are in flight at the same time.
+
+The ADK stack (google-adk / google-genai imports, model, session service and
+runner in agent.py) is built lazily on first use, or ahead of time in a
+background thread via `warm_up_in_background()`, so importing this module is
+cheap and the legacy form path never pays for it.
 """
 from __future__ import annotations
 
 import asyncio
-from typing import Final
-from google.genai import types
-from google.adk.events import Event
+import concurrent.futures
+import logging
+import queue
+import threading
+from collections import OrderedDict
+import time
+from types import ModuleType
+from typing import Any, AsyncIterator, Dict, Final, Iterator, Optional
 from uuid import uuid4
 
-# Import the already-configured runner from agent.py.  This triggers agent.py
-# once, creating the root_agent, session_service and runner objects.
-from .agent import runner, session_service  # noqa: E402
+from config import AGENT_WARMUP, FAST_PATH_ENABLED, KNOWN_SESSION_CACHE_SIZE, PREWARM_FIRST_TURN
+from custom_funcs.metrics import register_collector
+from .admission import AgentOverloadedError, AgentTurnTimeoutError, turn_admission
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Lazy ADK initialization
+# ---------------------------------------------------------------------------
+# agent.py is imported on first use. Importing it creates the root_agent,
+# session_service and runner objects once.
+_AGENT: Optional[ModuleType] = None
+_AGENT_LOCK = threading.Lock()
+# Seconds spent importing the ADK libraries and building the agent stack
+STARTUP_TIMINGS: Dict[str, float] = {}
+
+
+def _get_agent() -> ModuleType:
+    """Import and build the ADK stack once, recording how long it took."""
+    global _AGENT
+    if _AGENT is not None:
+        return _AGENT
+
+    with _AGENT_LOCK:
+        if _AGENT is None:
+            started = time.perf_counter()
+            import google.adk.runners  # noqa: F401
+            import google.genai  # noqa: F401
+            imported = time.perf_counter()
+
+            from . import agent
+            built = time.perf_counter()
+
+            STARTUP_TIMINGS["adk_import_seconds"] = imported - started
+            STARTUP_TIMINGS["agent_init_seconds"] = built - imported
+            logger.info(
+                "ADK stack ready: imports %.0f ms, agent init %.0f ms",
+                STARTUP_TIMINGS["adk_import_seconds"] * 1000,
+                STARTUP_TIMINGS["agent_init_seconds"] * 1000,
+            )
+            _AGENT = agent
+    return _AGENT
+
+
+def _collect_startup_timings():
+    yield (
+        "agent_startup_seconds",
+        "gauge",
+        "Time spent importing the ADK libraries and building the agent stack",
+        [({"phase": name.replace("_seconds", "")}, value) for name, value in sorted(STARTUP_TIMINGS.items())],
+    )
+
+
+register_collector(_collect_startup_timings)
+
+
+async def _load_agent() -> ModuleType:
+    """`_get_agent` for coroutines; a first-time build runs off the event loop."""
+    if _AGENT is not None:
+        return _AGENT
+    return await asyncio.to_thread(_get_agent)
+
+
+def warm_up_in_background() -> None:
+    """Build the ADK stack in a background thread so the first chat turn finds it ready."""
+    threading.Thread(target=_get_agent, name="adk-warmup", daemon=True).start()
+
+
+def override_model(model: Any) -> None:
+    """Run the agent (and the compaction summarizer) on `model` instead of Gemini.
+
+    Meant for offline runs such as the benchmark in bench/, which plugs in a
+    scripted `BaseLlm`. Model routing still rewrites the model name per turn,
+    but the calls go to this instance.
+    """
+    agent = _get_agent()
+    from google.adk.apps.llm_event_summarizer import LlmEventSummarizer
+
+    agent.root_agent.model = model
+    compaction = agent.agent_app.events_compaction_config
+    if compaction is not None and compaction.summarizer is not None:
+        compaction.summarizer = LlmEventSummarizer(llm=model)
+
 
 # ---------------------------------------------------------------------------
 # Persistent event loop
@@ -22,56 +113,372 @@ from .agent import runner, session_service  # noqa: E402
 # Creating a single event loop that remains open for the lifetime of the Flask
 # process prevents "Event loop is closed" errors that occur when asyncio.run()
 # closes a loop while background tasks are still pending.
+# The loop runs forever in its own daemon thread; request threads hand
+# coroutines to it with run_coroutine_threadsafe, so concurrent turns interleave
+# on the loop instead of queueing behind run_until_complete.
 _LOOP: asyncio.AbstractEventLoop = asyncio.new_event_loop()
-asyncio.set_event_loop(_LOOP)
+_LOOP_THREAD = threading.Thread(target=_LOOP.run_forever, name="adk-event-loop", daemon=True)
+_LOOP_THREAD.start()
 
-__all__ = ["ask_agent"]
+__all__ = [
+    "ask_agent",
+    "stream_agent",
+    "start_session",
+    "get_opening_reply",
+    "get_collected_answers",
+    "warm_up_in_background",
+    "AgentOverloadedError",
+    "AgentTurnTimeoutError",
+]
 
 
+# ---------------------------------------------------------------------------
+# Known-session cache
+# ---------------------------------------------------------------------------
+# Session ids we know already exist in the session store, most recently used
+# last. Steady-state turns skip the create_session round trip entirely.
+# Only touched from coroutines running on _LOOP, so no extra locking is needed.
+_KNOWN_SESSIONS: "OrderedDict[str, None]" = OrderedDict()
+# In-flight get-or-create operations, so concurrent callers share one round trip
+_SESSION_TASKS: dict[str, asyncio.Task] = {}
+
+
+def _remember_session(session_id: str) -> None:
+    _KNOWN_SESSIONS[session_id] = None
+    _KNOWN_SESSIONS.move_to_end(session_id)
+    while len(_KNOWN_SESSIONS) > KNOWN_SESSION_CACHE_SIZE:
+        _KNOWN_SESSIONS.popitem(last=False)
 
-async def _ask_async(prompt: str, session_id: str) -> list[str]:
-    """Async helper that forwards the prompt to the ADK runner using given session id."""
-    
-    WELCOME_TEXT = "Hello! I'm here to help you complete your onboarding. Ready to start?"
 
-    # Ensure the session exists in the database before running
+async def _get_or_create_session(
+    session_id: str, is_new: bool, state: Optional[dict[str, Any]] = None
+) -> None:
     try:
-        await session_service.create_session(
-            app_name=runner.app_name,
-            user_id=session_id,
-            session_id=session_id
+        agent = await _load_agent()
+        existing = None
+        if not is_new:
+            existing = await agent.session_service.get_session(
+                app_name=agent.runner.app_name,
+                user_id=session_id,
+                session_id=session_id
+            )
+        if existing is None:
+            try:
+                await agent.session_service.create_session(
+                    app_name=agent.runner.app_name,
+                    user_id=session_id,
+                    session_id=session_id,
+                    state=state,
+                )
+            except Exception:
+                # Most likely created concurrently by another worker; don't cache
+                # it and let the run itself report a genuinely missing session
+                logger.warning("Could not create session %s", session_id, exc_info=True)
+                return
+        _remember_session(session_id)
+    finally:
+        _SESSION_TASKS.pop(session_id, None)
+
+
+async def _ensure_session(
+    session_id: str, is_new: bool = False, state: Optional[dict[str, Any]] = None
+) -> None:
+    """Make sure the ADK session exists, consulting the known-session cache first."""
+    if session_id in _KNOWN_SESSIONS:
+        _KNOWN_SESSIONS.move_to_end(session_id)
+        return
+
+    task = _SESSION_TASKS.get(session_id)
+    if task is None:
+        task = asyncio.create_task(_get_or_create_session(session_id, is_new, state))
+        _SESSION_TASKS[session_id] = task
+    await task
+
+
+# ---------------------------------------------------------------------------
+# Pre-warmed sessions
+# ---------------------------------------------------------------------------
+# Background pre-warm per freshly minted session id. Each future resolves to the
+# pre-generated opening reply (or None when PREWARM_FIRST_TURN is off). Read from
+# Flask threads and from the loop, hence the lock.
+_PREWARMS: "OrderedDict[str, concurrent.futures.Future]" = OrderedDict()
+_PREWARMS_LOCK = threading.Lock()
+# Question schemas of sessions served while the ADK stack was not built yet in
+# lazy warm-up mode; the first chat turn seeds its session with it
+_DEFERRED_SEEDS: "OrderedDict[str, Optional[list[dict[str, Any]]]]" = OrderedDict()
+
+# Hidden first message used to generate the opening question ahead of time
+OPENING_PROMPT = "Hi, I'm ready to start my onboarding."
+
+# Session state prefix of the answers saved by the agent's tools
+USER_STATE_PREFIX = "user:"
+
+
+def _get_prewarm(session_id: str) -> Optional[concurrent.futures.Future]:
+    with _PREWARMS_LOCK:
+        return _PREWARMS.get(session_id)
+
+
+async def _prewarm_session(
+    session_id: str, questions: Optional[list[dict[str, Any]]], with_opening: bool
+) -> Optional[list[str]]:
+    agent = await _load_agent()
+    # Seed the question schema with the session so the first turn needs no schema tool call
+    state = {"app:question_schema": agent.build_question_schema(questions)} if questions else None
+    await _ensure_session(session_id, is_new=True, state=state)
+
+    if not with_opening:
+        return None
+    return await _ask_async(OPENING_PROMPT, session_id, wait_for_prewarm=False)
+
+
+def start_session(
+    session_id: str, questions: Optional[list[dict[str, Any]]] = None, opening: bool = True
+) -> None:
+    """Pre-warm the ADK session for a freshly minted session id in the background.
+
+    Called when the chat page is served: the session is created with the
+    question schema already in its state and, if PREWARM_FIRST_TURN is set and
+    `opening` is true, the agent's opening question is generated right away
+    (see `get_opening_reply`). Failures are retried lazily on the first turn.
+
+    With AGENT_WARMUP=lazy, page views never build the ADK stack: until the
+    first chat turn has built it, only the schema is kept for that turn.
+    """
+    if AGENT_WARMUP == "lazy" and _AGENT is None:
+        with _PREWARMS_LOCK:
+            _DEFERRED_SEEDS[session_id] = questions
+            while len(_DEFERRED_SEEDS) > KNOWN_SESSION_CACHE_SIZE:
+                _DEFERRED_SEEDS.popitem(last=False)
+        return
+
+    future = None
+    if PREWARM_FIRST_TURN and opening:
+        # The opening turn is a model call like any other and goes through admission control
+        try:
+            future = turn_admission.submit(_prewarm_session(session_id, questions, True), _LOOP)
+        except AgentOverloadedError:
+            logger.info("Agent at capacity, skipping the opening turn for session %s", session_id)
+    if future is None:
+        future = asyncio.run_coroutine_threadsafe(
+            _prewarm_session(session_id, questions, False), _LOOP
         )
+    with _PREWARMS_LOCK:
+        _PREWARMS[session_id] = future
+        while len(_PREWARMS) > KNOWN_SESSION_CACHE_SIZE:
+            _PREWARMS.popitem(last=False)
+
 
+def get_opening_reply(session_id: str, timeout: float) -> Optional[list[str]]:
+    """Return the pre-generated opening reply for a session, waiting up to `timeout` seconds.
+
+    Returns None if no opening was generated or it isn't ready in time.
+    """
+    prewarm = _get_prewarm(session_id)
+    if prewarm is None:
+        return None
+    try:
+        return prewarm.result(timeout=timeout)
     except Exception:
-        # Session likely already exists, which is fine
-        pass
+        logger.warning("Opening reply unavailable for session %s", session_id, exc_info=True)
+        return None
+
+
+async def _collected_answers(session_id: str) -> dict[str, Any]:
+    agent = await _load_agent()
+    from google.adk.sessions.base_session_service import GetSessionConfig
+
+    # Only the state is needed, not the conversation
+    stored = await agent.session_service.get_session(
+        app_name=agent.runner.app_name,
+        user_id=session_id,
+        session_id=session_id,
+        config=GetSessionConfig(num_recent_events=1),
+    )
+    if stored is None:
+        return {}
+    return {
+        key[len(USER_STATE_PREFIX):]: value
+        for key, value in stored.state.items()
+        if key.startswith(USER_STATE_PREFIX) and value not in (None, "")
+    }
+
+
+def get_collected_answers(session_id: str, timeout: float = 5.0) -> dict[str, Any]:
+    """Return the answers a chat session has collected so far, keyed by entity.
+
+    Used to prefill the form when a visitor is moved off the chat. Returns an
+    empty dict for unknown sessions or when the store doesn't answer in time.
+    """
+    future = asyncio.run_coroutine_threadsafe(_collected_answers(session_id), _LOOP)
+    try:
+        return future.result(timeout=timeout)
+    except Exception:
+        future.cancel()
+        logger.warning("Could not read collected answers of session %s", session_id, exc_info=True)
+        return {}
+
 
+FALLBACK_TEXT = "Sorry, my functions needs polishing, can you please repeat?"
+
+
+async def _iter_text_parts(
+    prompt: str, session_id: str, wait_for_prewarm: bool = True
+) -> AsyncIterator[str]:
+    """Forward the prompt to the ADK runner and yield text parts as events arrive."""
+
+    WELCOME_TEXT = "Hello! I'm here to help you complete your onboarding. Ready to start?"
+
+    # Let a still-running pre-warm (session creation / opening turn) finish first,
+    # so the turn uses the warmed session and never races the opening invocation
+    prewarm = _get_prewarm(session_id) if wait_for_prewarm else None
+    if prewarm is not None and not prewarm.done():
+        await asyncio.wait([asyncio.wrap_future(prewarm)])
+
+    agent = await _load_agent()
+    from google.genai import types
+    from .session_backend import start_turn_timing
+    from .telemetry import TurnMetrics
+
+    turn = TurnMetrics()
+    session_timing = start_turn_timing()
+
+    # Only the first turn of an unknown session touches the session store here
+    with _PREWARMS_LOCK:
+        deferred_questions = _DEFERRED_SEEDS.pop(session_id, None)
+    state = None
+    if deferred_questions:
+        state = {"app:question_schema": agent.build_question_schema(deferred_questions)}
+    await _ensure_session(session_id, state=state)
+
+    if FAST_PATH_ENABLED:
+        from .fast_path import answer_directly
+
+        # A plain answer to a strictly validated question needs no model call
+        reply = await answer_directly(agent, session_id, prompt)
+        if reply is not None:
+            turn.finish("fast_path")
+            yield reply
+            return
 
     # Create a Content object for the user message
     message = types.Content(role="user", parts=[types.Part(text=prompt)])
 
     # Use run_async directly, passing session_id as user_id to ensure isolation
-    response_iterator = runner.run_async(new_message=message, session_id=session_id, user_id=session_id)
-
-    collected_text = []
-    async for event in response_iterator:
-        if event.content and event.content.parts:
-            for part in event.content.parts:
-                if part.text:
-                    collected_text.append(part.text)
-    
+    response_iterator = agent.runner.run_async(new_message=message, session_id=session_id, user_id=session_id)
+
+    # Count model round trips, tool calls and tokens so the cost of a turn is visible
+    outcome = "error"
+    try:
+        async for event in response_iterator:
+            turn.on_event(event)
+
+            if event.content and event.content.parts:
+                for part in event.content.parts:
+                    if part.text:
+                        yield part.text
+        outcome = "success"
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    finally:
+        elapsed = turn.finish(outcome)
+
+    logger.info(
+        "Turn finished for session %s in %.0f ms: %d LLM calls, %d tool calls, "
+        "%d prompt / %d output tokens, session store %d reads / %.0f ms, %d writes / %.0f ms",
+        session_id, elapsed * 1000, turn.llm_calls, turn.tool_calls,
+        turn.prompt_tokens, turn.output_tokens,
+        session_timing["reads"], session_timing["read_seconds"] * 1000,
+        session_timing["writes"], session_timing["write_seconds"] * 1000,
+    )
+
+
+async def _ask_async(prompt: str, session_id: str, wait_for_prewarm: bool = True) -> list[str]:
+    """Async helper that forwards the prompt to the ADK runner using given session id."""
+    collected_text = [text async for text in _iter_text_parts(prompt, session_id, wait_for_prewarm)]
+
     if collected_text:
         return collected_text
-    
+
     # Fallback if no valid text found
-    return ["Sorry, my functions needs polishing, can you please repeat?"]
+    return [FALLBACK_TEXT]
 
 
 def ask_agent(prompt: str, session_id: str) -> list[str]:
     """Synchronous wrapper executed inside Flask using the persistent loop.
 
+    Safe to call from any number of request threads at once; the calling
+    thread blocks until its own turn finishes.
+
     Args:
         prompt: User message.
         session_id: Unique identifier for the user's chat session (e.g. per-browser).
+
+    Raises:
+        AgentOverloadedError: Too many turns are running or queued already.
+        AgentTurnTimeoutError: The turn was cancelled at its deadline.
     """
-    return _LOOP.run_until_complete(_ask_async(prompt, session_id))
+    future = turn_admission.submit(_ask_async(prompt, session_id), _LOOP)
+    return future.result()
+
+
+
+def stream_agent(prompt: str, session_id: str) -> Iterator[str]:
+    """Start a turn and return an iterator yielding each text part as soon as the agent produces it.
+
+    The turn runs on the persistent loop; parts are handed back to the calling
+    (Flask) thread through a queue. Closing the iterator early, e.g. when the
+    client disconnects, cancels the turn.
+
+    Args:
+        prompt: User message.
+        session_id: Unique identifier for the user's chat session (e.g. per-browser).
+
+    Raises:
+        AgentOverloadedError: Raised here, before anything is streamed, when too
+            many turns are running or queued already. A turn cancelled at its
+            deadline raises AgentTurnTimeoutError from the iterator.
+    """
+    parts: "queue.Queue[object]" = queue.Queue()
+    done = object()
+
+    async def _relay() -> None:
+        produced_text = False
+        async for text in _iter_text_parts(prompt, session_id):
+            produced_text = True
+            parts.put(text)
+        if not produced_text:
+            parts.put(FALLBACK_TEXT)
+
+    async def _pump() -> None:
+        try:
+            await _relay()
+        except Exception as exc:
+            parts.put(exc)
+            # Re-raised so admission control counts the failed turn
+            raise
+
+    future = turn_admission.submit(_pump(), _LOOP)
+    # Signalled from the future rather than from _pump, which never runs when the
+    # turn is cut off while still queued for a slot
+    future.add_done_callback(lambda _future: parts.put(done))
+    return _drain_parts(parts, done, future)
+
+
+def _drain_parts(
+    parts: "queue.Queue[object]", done: object, future: concurrent.futures.Future
+) -> Iterator[str]:
+    try:
+        while True:
+            item = parts.get()
+            if item is done:
+                # A turn cut off at its deadline ends without an error part; this raises it
+                future.result()
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        if not future.done():
+            future.cancel()
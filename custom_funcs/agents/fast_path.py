@@ -0,0 +1,192 @@
+"""Rule-based fast path for plain answers to the question asked last.
+
+Most onboarding turns are a bare answer, e.g. an email address after
+"What's your email address?". When the message on its own passes the strict
+rule of the question the agent asked last (field type email / integer /
+number, allowed values or a validation regex from the sheet), the answer is
+saved to the session state exactly like `save_user_info` does and the next
+pending question is sent from FAST_PATH_REPLY_TEMPLATE, without a model call.
+
+Everything else goes to the agent as before: free-text questions (a name
+could be any text), invalid answers, user questions, and the end of the
+onboarding, where the agent registers the user.
+
+The open question of each session and its rule are kept in process
+(`remember_open_question`, fed by the status tools), so turns that go to the
+model anyway cost no extra session read; the session is only loaded, and
+the answer re-checked against its state, when the message passes the rule.
+"""
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from google.adk.events import Event, EventActions
+from google.adk.sessions.base_session_service import GetSessionConfig
+from google.genai import types
+
+from config import FAST_PATH_REPLY_TEMPLATE, KNOWN_SESSION_CACHE_SIZE
+from custom_funcs.metrics import Counter
+from custom_funcs.validation import FieldRule, get_validator
+
+logger = logging.getLogger(__name__)
+
+FAST_PATH_TURNS = Counter(
+    "agent_fast_path_turns_total", "User messages answered by the fast path or handed to the model", ["outcome"]
+)
+
+# Field types whose rule alone tells an answer from other text
+STRICT_FIELD_TYPES = ("email", "integer", "number", "enum")
+
+# Open question per chat session: (entity, its rule if strict, else None). Only
+# touched from the agent loop (tools and turns), so no locking is needed.
+_OPEN_QUESTIONS: "OrderedDict[str, Tuple[str, Optional[FieldRule]]]" = OrderedDict()
+
+
+def _is_strict(rule: FieldRule) -> bool:
+    return rule.field_type in STRICT_FIELD_TYPES or bool(rule.allowed_values) or rule.pattern is not None
+
+
+def remember_open_question(
+    session_id: str, entity: Optional[str], schema: Optional[List[Dict[str, Any]]]
+) -> None:
+    """Record the question the session's next message is expected to answer."""
+    if not entity:
+        _OPEN_QUESTIONS.pop(session_id, None)
+        return
+    rule = get_validator(schema).rules.get(entity) if schema else None
+    _OPEN_QUESTIONS[session_id] = (entity, rule if rule is not None and _is_strict(rule) else None)
+    _OPEN_QUESTIONS.move_to_end(session_id)
+    while len(_OPEN_QUESTIONS) > KNOWN_SESSION_CACHE_SIZE:
+        _OPEN_QUESTIONS.popitem(last=False)
+
+
+def _precheck(session_id: str, message: str) -> str:
+    """Decide from the remembered open question alone; "candidate" needs the session."""
+    open_question = _OPEN_QUESTIONS.get(session_id)
+    if open_question is None:
+        return "no_question"
+    _, rule = open_question
+    if rule is None:
+        return "free_text"
+    value = _normalize(message)
+    if not value or "?" in value or rule.check(value) is not None:
+        return "no_match"
+    return "candidate"
+
+
+def _normalize(message: str) -> str:
+    # "john@example.com." is still just the address
+    return (message or "").strip().rstrip(".!").strip()
+
+
+def _next_question(
+    schema: List[Dict[str, Any]], state: Dict[str, Any], answered: str
+) -> Optional[Dict[str, Any]]:
+    """First pending question once `answered` is saved, in the schema's asking order."""
+    for item in schema:
+        entity = item.get("questioned_entity")
+        if entity != answered and not state.get(f"user:{entity}"):
+            return item
+    return None
+
+
+def _match(
+    message: str, state: Dict[str, Any], asked_entity_key: str
+) -> Tuple[Optional[Tuple[str, str, Dict[str, Any]]], str]:
+    """Return ((entity, value, next question), "answered") or (None, reason to skip)."""
+    entity = state.get(asked_entity_key)
+    if not entity:
+        return None, "no_question"
+    if state.get(f"user:{entity}"):
+        # Saved meanwhile through another tool; the marker is stale
+        return None, "no_question"
+
+    value = _normalize(message)
+    if not value or "?" in value:
+        return None, "no_match"
+
+    # The session's schema carries the sheet's constraints, so no provider call on the loop
+    schema = state.get("app:question_schema") or []
+    rule = get_validator(schema).rules.get(entity)
+    if rule is None or not _is_strict(rule):
+        return None, "free_text"
+    if rule.check(value) is not None:
+        # The model explains what is wrong with the answer
+        return None, "no_match"
+
+    next_question = _next_question(schema, state, entity)
+    if next_question is None or not next_question.get("question_phrasing_example"):
+        # Registration and the closing message stay with the agent
+        return None, "last_question"
+    return (entity, value, next_question), "answered"
+
+
+async def answer_directly(agent: Any, session_id: str, message: str) -> Optional[str]:
+    """Save `message` as the answer to the asked question and return the templated reply.
+
+    Returns None, writing nothing, when the message is not an unambiguous
+    answer; the turn then goes to the model. `agent` is the loaded agent module.
+    """
+    outcome = _precheck(session_id, message)
+    if outcome != "candidate":
+        FAST_PATH_TURNS.inc(outcome=outcome)
+        return None
+
+    session = await agent.session_service.get_session(
+        app_name=agent.runner.app_name,
+        user_id=session_id,
+        session_id=session_id,
+        # Only the state is needed, not the conversation
+        config=GetSessionConfig(num_recent_events=1),
+    )
+    if session is None:
+        FAST_PATH_TURNS.inc(outcome="no_session")
+        return None
+
+    try:
+        match, outcome = _match(message, session.state, agent.ASKED_ENTITY_KEY)
+        if match is not None:
+            entity, value, next_question = match
+            reply = FAST_PATH_REPLY_TEMPLATE.format(
+                value=value,
+                question=next_question["question_phrasing_example"],
+                entity=next_question["questioned_entity"],
+            )
+    except Exception:
+        # A broken template or schema must never fail the turn; the model still can answer
+        logger.warning("Fast path failed for session %s", session_id, exc_info=True)
+        match, outcome = None, "error"
+    FAST_PATH_TURNS.inc(outcome=outcome)
+    if match is None:
+        return None
+
+    # Same history and state as a model turn that called save_answers_and_get_next
+    invocation_id = f"e-{uuid4()}"
+    await agent.session_service.append_event(
+        session,
+        Event(
+            invocation_id=invocation_id,
+            author="user",
+            content=types.Content(role="user", parts=[types.Part(text=message)]),
+        ),
+    )
+    await agent.session_service.append_event(
+        session,
+        Event(
+            invocation_id=invocation_id,
+            author=agent.root_agent.name,
+            content=types.Content(role="model", parts=[types.Part(text=reply)]),
+            actions=EventActions(
+                state_delta={
+                    f"user:{entity}": value,
+                    agent.ASKED_ENTITY_KEY: next_question["questioned_entity"],
+                }
+            ),
+        ),
+    )
+    remember_open_question(
+        session_id, next_question["questioned_entity"], session.state.get("app:question_schema")
+    )
+    logger.info("Fast path saved %s for session %s", entity, session_id)
+    return reply
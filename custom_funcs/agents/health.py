@@ -0,0 +1,106 @@
+"""Rolling health of agent turns, used to fall back to the form view.
+
+Every finished, timed-out or rejected turn is recorded with its latency. Over
+the last AGENT_HEALTH_WINDOW_SECONDS the agent counts as degraded when the
+p95 latency exceeds AGENT_DEGRADED_P95_SECONDS or the error rate exceeds
+AGENT_DEGRADED_ERROR_RATE, given at least AGENT_HEALTH_MIN_SAMPLES turns.
+
+While degraded, new visitors get the form first and so produce few turns.
+Old samples age out of the window and the agent counts as healthy again,
+which lets the chat view probe a recovering Gemini.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+from config import (
+    AGENT_HEALTH_WINDOW_SECONDS,
+    AGENT_HEALTH_MIN_SAMPLES,
+    AGENT_DEGRADED_P95_SECONDS,
+    AGENT_DEGRADED_ERROR_RATE,
+)
+from custom_funcs.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+
+class AgentHealth:
+    """Sliding window of (timestamp, latency, ok) samples of agent turns."""
+
+    def __init__(
+        self,
+        window_seconds: float = AGENT_HEALTH_WINDOW_SECONDS,
+        min_samples: int = AGENT_HEALTH_MIN_SAMPLES,
+        p95_threshold: float = AGENT_DEGRADED_P95_SECONDS,
+        error_rate_threshold: float = AGENT_DEGRADED_ERROR_RATE,
+    ):
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.p95_threshold = p95_threshold
+        self.error_rate_threshold = error_rate_threshold
+
+        self._lock = threading.Lock()
+        self._samples: Deque[Tuple[float, float, bool]] = deque()
+        self._degraded = False
+
+    def record(self, latency: float, ok: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, latency, ok))
+            self._prune(now)
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def snapshot(self) -> Dict[str, float]:
+        """Sample count, p95 latency, error rate and degraded flag of the current window."""
+        with self._lock:
+            self._prune(time.monotonic())
+            latencies = sorted(latency for _, latency, _ in self._samples)
+            errors = sum(1 for _, _, ok in self._samples if not ok)
+
+            count = len(latencies)
+            p95 = latencies[max(1, math.ceil(0.95 * count)) - 1] if count else 0.0
+            error_rate = errors / count if count else 0.0
+            degraded = count >= self.min_samples and (
+                p95 > self.p95_threshold or error_rate > self.error_rate_threshold
+            )
+
+            if degraded != self._degraded:
+                self._degraded = degraded
+                logger.warning(
+                    "Agent %s: p95 %.1f s, error rate %.0f%% over %d turns",
+                    "degraded, serving the form first" if degraded else "healthy again",
+                    p95, error_rate * 100, count,
+                )
+        return {"samples": count, "p95_seconds": p95, "error_rate": error_rate, "degraded": degraded}
+
+    def is_degraded(self) -> bool:
+        return bool(self.snapshot()["degraded"])
+
+
+agent_health = AgentHealth()
+
+
+def _collect_health():
+    snapshot = agent_health.snapshot()
+    yield (
+        "agent_degraded",
+        "gauge",
+        "1 while new visitors are sent to the form because agent turns are slow or failing",
+        [({}, int(snapshot["degraded"]))],
+    )
+    yield (
+        "agent_health_window",
+        "gauge",
+        "Agent turn samples, p95 latency and error rate over the health window",
+        [({"stat": name}, snapshot[name]) for name in ("samples", "p95_seconds", "error_rate")],
+    )
+
+
+register_collector(_collect_health)
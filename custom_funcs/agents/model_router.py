@@ -0,0 +1,77 @@
+"""Per-turn model routing between a fast model and the pro model.
+
+Most onboarding turns are simple (acknowledge the answer, ask the next
+question), so they run on FAST_MODEL_NAME. Turns that look complex, such as
+long messages, user questions / off-topic talk or several answers at once,
+are escalated to PRO_MODEL_NAME.
+
+The router is attached to the agent as a `before_model_callback` and rewrites
+`llm_request.model`, so every LLM call of an invocation uses the tier chosen for
+that invocation's user message.
+"""
+import logging
+import re
+from typing import Optional, Tuple
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+
+from config import (
+    MODEL_ROUTING_ENABLED,
+    FAST_MODEL_NAME,
+    PRO_MODEL_NAME,
+    MODEL_ROUTING_MAX_SIMPLE_WORDS,
+)
+
+logger = logging.getLogger(__name__)
+
+SIMPLE = "simple"
+COMPLEX = "complex"
+
+# Separators that usually mean the user packed several answers into one message
+_ANSWER_SEPARATOR_RE = re.compile(r",|;|\n|\band\b", re.IGNORECASE)
+_EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
+
+def classify_turn(message: str) -> Tuple[str, str]:
+    """Return (tier, reason) for a user message."""
+    text = (message or "").strip()
+    if not text:
+        return SIMPLE, "empty message"
+
+    if len(text.split()) > MODEL_ROUTING_MAX_SIMPLE_WORDS:
+        return COMPLEX, "long message"
+
+    if "?" in text:
+        return COMPLEX, "user question"
+
+    if len(_EMAIL_RE.findall(text)) > 1 or len(_ANSWER_SEPARATOR_RE.findall(text)) >= 2:
+        return COMPLEX, "multiple answers"
+
+    return SIMPLE, "short answer"
+
+
+def _user_text(callback_context: CallbackContext) -> str:
+    content = callback_context.user_content
+    if not content or not content.parts:
+        return ""
+    return " ".join(part.text for part in content.parts if part.text)
+
+
+def route_model(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """`before_model_callback` picking the model tier for the current turn."""
+    if not MODEL_ROUTING_ENABLED:
+        return None
+
+    tier, reason = classify_turn(_user_text(callback_context))
+    llm_request.model = PRO_MODEL_NAME if tier == COMPLEX else FAST_MODEL_NAME
+
+    logger.info(
+        "Model routing: invocation=%s tier=%s model=%s reason=%s",
+        callback_context.invocation_id, tier, llm_request.model, reason,
+    )
+    # Returning None lets the (re-targeted) model call go ahead
+    return None
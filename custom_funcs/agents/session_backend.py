@@ -0,0 +1,273 @@
+"""Session storage for the ADK runner, selected by configuration.
+
+SESSION_BACKEND picks where conversations live:
+
+    database  DatabaseSessionService on SUPABASE_ONBOARDING_AGENT_MEMORY_DB_URL
+              (Postgres), with an explicitly sized connection pool
+    sqlite    DatabaseSessionService on a local SQLite file in WAL mode, so
+              load tests and development run fully offline
+    memory    InMemorySessionService (lost on restart)
+
+Whatever the backend, the service is wrapped in `TimedSessionService`, which
+measures every read and write. Totals are available from
+`get_session_latency_stats()`, and `start_turn_timing()` collects the session
+time spent by a single agent turn. Calls into the database backends run on
+SESSION_DB_POOL_SIZE + SESSION_DB_MAX_OVERFLOW worker threads, because ADK
+does their SQL synchronously, so the pool settings bound the session I/O in
+flight.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from google.adk.events import Event
+from google.adk.events.event_actions import EventCompaction
+from google.adk.sessions import (
+    BaseSessionService,
+    DatabaseSessionService,
+    InMemorySessionService,
+    Session,
+)
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from sqlalchemy import event
+
+from config import (
+    SESSION_BACKEND,
+    SESSION_DB_POOL_SIZE,
+    SESSION_DB_MAX_OVERFLOW,
+    SESSION_DB_POOL_PRE_PING,
+    SESSION_DB_POOL_RECYCLE_SECONDS,
+    SESSION_SQLITE_PATH,
+)
+from custom_funcs.metrics import register_collector
+
+logger = logging.getLogger(__name__)
+
+READ = "read"
+WRITE = "write"
+
+# Session time of the agent turn running in the current task, if one is being timed
+_turn_timing: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "session_turn_timing", default=None
+)
+
+# The service built by build_session_service, for stats reporting
+_service: Optional["TimedSessionService"] = None
+
+
+def start_turn_timing() -> Dict[str, float]:
+    """Start collecting session latency for the current turn and return the totals dict.
+
+    The dict is filled in place with reads, writes, read_seconds and write_seconds.
+    """
+    timing = {"reads": 0, "writes": 0, "read_seconds": 0.0, "write_seconds": 0.0}
+    _turn_timing.set(timing)
+    return timing
+
+
+def _restore_compactions(session: Session) -> None:
+    """Turn compaction records loaded back as plain dicts into EventCompaction objects.
+
+    DatabaseSessionService rebuilds event actions with `model_copy(update=...)`,
+    which skips validation, so a stored compaction comes back as a dict and the
+    next turn fails while assembling the prompt.
+    """
+    for stored_event in session.events:
+        compaction = stored_event.actions.compaction if stored_event.actions else None
+        if isinstance(compaction, dict):
+            stored_event.actions.compaction = EventCompaction.model_validate(compaction)
+
+
+class TimedSessionService(BaseSessionService):
+    """Delegating session service that records how long each operation takes."""
+
+    def __init__(self, inner: BaseSessionService, backend: str, io_threads: int = 0):
+        self.inner = inner
+        self.backend = backend
+        # ADK's DatabaseSessionService does blocking SQLAlchemy I/O inside its async
+        # methods, which would stall every turn on the shared event loop. Such calls
+        # run on `io_threads` worker threads instead, one pooled connection each.
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if io_threads > 0:
+            self._executor = ThreadPoolExecutor(
+                max_workers=io_threads, thread_name_prefix="session-io"
+            )
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        # e.g. db_engine of the database backends
+        return getattr(self.inner, name)
+
+    def _record(self, operation: str, kind: str, elapsed: float) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(
+                operation, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            )
+            stats["count"] += 1
+            stats["total_seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+
+        timing = _turn_timing.get()
+        if timing is not None:
+            timing[f"{kind}s"] += 1
+            timing[f"{kind}_seconds"] += elapsed
+
+    async def _timed(self, operation: str, kind: str, call):
+        started = time.perf_counter()
+        try:
+            if self._executor is not None:
+                # Run the call to completion on a worker thread with its own event loop
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._executor, asyncio.run, call
+                )
+            return await call
+        finally:
+            self._record(operation, kind, time.perf_counter() - started)
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        return await self._timed(
+            "create_session",
+            WRITE,
+            self.inner.create_session(
+                app_name=app_name, user_id=user_id, state=state, session_id=session_id
+            ),
+        )
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        session = await self._timed(
+            "get_session",
+            READ,
+            self.inner.get_session(
+                app_name=app_name, user_id=user_id, session_id=session_id, config=config
+            ),
+        )
+        if session is not None:
+            _restore_compactions(session)
+        return session
+
+    async def list_sessions(
+        self, *, app_name: str, user_id: Optional[str] = None
+    ) -> ListSessionsResponse:
+        return await self._timed(
+            "list_sessions", READ, self.inner.list_sessions(app_name=app_name, user_id=user_id)
+        )
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        return await self._timed(
+            "delete_session",
+            WRITE,
+            self.inner.delete_session(app_name=app_name, user_id=user_id, session_id=session_id),
+        )
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        return await self._timed("append_event", WRITE, self.inner.append_event(session, event))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-operation count, total and max latency since startup."""
+        with self._lock:
+            operations = {
+                operation: {
+                    **stats,
+                    "avg_seconds": stats["total_seconds"] / stats["count"] if stats["count"] else 0.0,
+                }
+                for operation, stats in self._stats.items()
+            }
+        return {"backend": self.backend, "operations": operations}
+
+
+def _sqlite_session_service(path: str) -> DatabaseSessionService:
+    # The busy timeout lets concurrent writers wait for the lock instead of failing
+    service = DatabaseSessionService(
+        db_url=f"sqlite:///{path}",
+        connect_args={"timeout": 30},
+        pool_size=SESSION_DB_POOL_SIZE,
+        max_overflow=SESSION_DB_MAX_OVERFLOW,
+    )
+
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    event.listen(service.db_engine, "connect", _set_pragmas)
+    # Drop the connection opened while creating the tables so every pooled one gets the pragmas
+    service.db_engine.dispose()
+    return service
+
+
+def build_session_service(db_url: Optional[str]) -> TimedSessionService:
+    """Create the configured session service, wrapped for latency measurement."""
+    global _service
+    backend = SESSION_BACKEND
+    if backend == "memory":
+        inner: BaseSessionService = InMemorySessionService()
+    elif backend == "sqlite":
+        inner = _sqlite_session_service(SESSION_SQLITE_PATH)
+    elif backend == "database":
+        if not db_url:
+            raise ValueError(
+                "SESSION_BACKEND=database needs SUPABASE_ONBOARDING_AGENT_MEMORY_DB_URL"
+            )
+        pool_kwargs: Dict[str, Any] = {}
+        if not db_url.startswith("sqlite"):
+            # One connection per session I/O thread (see TimedSessionService)
+            pool_kwargs = {
+                "pool_size": SESSION_DB_POOL_SIZE,
+                "max_overflow": SESSION_DB_MAX_OVERFLOW,
+                "pool_pre_ping": SESSION_DB_POOL_PRE_PING,
+                "pool_recycle": SESSION_DB_POOL_RECYCLE_SECONDS,
+            }
+        inner = DatabaseSessionService(db_url=db_url, **pool_kwargs)
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND '{backend}' (expected database, sqlite or memory)")
+
+    # Database calls run on their own threads, as many as the pool has connections
+    io_threads = 0 if backend == "memory" else SESSION_DB_POOL_SIZE + SESSION_DB_MAX_OVERFLOW
+    logger.info("Session backend: %s", backend)
+    _service = TimedSessionService(inner, backend, io_threads)
+    return _service
+
+
+def get_session_latency_stats() -> Optional[Dict[str, Any]]:
+    """Latency stats of the active session service, or None before it is built."""
+    return _service.get_stats() if _service is not None else None
+
+
+def _collect_session_stats():
+    stats = get_session_latency_stats()
+    operations = sorted(stats["operations"].items()) if stats else []
+    yield (
+        "agent_session_store_operations_total",
+        "counter",
+        "Session store operations by the agent runner",
+        [({"operation": name}, op["count"]) for name, op in operations],
+    )
+    yield (
+        "agent_session_store_seconds_total",
+        "counter",
+        "Time spent in session store operations",
+        [({"operation": name}, op["total_seconds"]) for name, op in operations],
+    )
+
+
+register_collector(_collect_session_stats)
@@ -0,0 +1,114 @@
+"""Agent turn and tool instrumentation.
+
+`TurnMetrics` follows the events of one `runner.run_async` call and records the
+number of LLM calls, token usage and timings of the turn. The tool callbacks
+are attached to the agent and time every tool the model invokes.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.tool_context import ToolContext
+
+from custom_funcs.metrics import COUNT_BUCKETS, TOKEN_BUCKETS, Counter, Histogram
+
+TURN_SECONDS = Histogram(
+    "agent_turn_seconds", "Wall time of an agent turn, session lookup included", ["outcome"]
+)
+TURN_LLM_CALLS = Histogram("agent_turn_llm_calls", "LLM calls per agent turn", buckets=COUNT_BUCKETS)
+TURN_TOOL_CALLS = Histogram("agent_turn_tool_calls", "Tool calls per agent turn", buckets=COUNT_BUCKETS)
+TURN_TOKENS = Histogram(
+    "agent_turn_tokens", "Tokens per agent turn", ["kind"], buckets=TOKEN_BUCKETS
+)
+LLM_CALL_SECONDS = Histogram(
+    "agent_llm_call_seconds", "Time until a model response event, from the previous event of the turn"
+)
+LLM_CALLS = Counter("agent_llm_calls_total", "LLM calls made by agent turns")
+TOKENS = Counter("agent_tokens_total", "Tokens reported in model usage metadata", ["kind"])
+TOOL_SECONDS = Histogram("agent_tool_seconds", "Execution time of agent tools", ["tool", "outcome"])
+
+# Start times of tool calls in flight, keyed by function call id. No callback runs
+# when a tool is cancelled with its turn, so the oldest entries are dropped past the cap.
+MAX_TRACKED_TOOL_CALLS = 1024
+_tool_started: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+_tool_started_lock = threading.Lock()
+
+
+class TurnMetrics:
+    """Per-turn counters fed with every event `runner.run_async` yields."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last_event = self.started
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+
+    def on_event(self, event: Any) -> None:
+        now = time.perf_counter()
+        if event.content and event.content.role == "model" and not event.partial:
+            self.llm_calls += 1
+            LLM_CALLS.inc()
+            LLM_CALL_SECONDS.observe(now - self._last_event)
+
+            usage = event.usage_metadata
+            if usage is not None:
+                self.prompt_tokens += usage.prompt_token_count or 0
+                self.output_tokens += usage.candidates_token_count or 0
+        self.tool_calls += len(event.get_function_calls())
+        self._last_event = now
+
+    def finish(self, outcome: str = "success") -> float:
+        """Record the turn and return its duration in seconds."""
+        elapsed = time.perf_counter() - self.started
+        TURN_SECONDS.observe(elapsed, outcome=outcome)
+        TURN_LLM_CALLS.observe(self.llm_calls)
+        TURN_TOOL_CALLS.observe(self.tool_calls)
+        TURN_TOKENS.observe(self.prompt_tokens, kind="prompt")
+        TURN_TOKENS.observe(self.output_tokens, kind="output")
+        TOKENS.inc(self.prompt_tokens, kind="prompt")
+        TOKENS.inc(self.output_tokens, kind="output")
+        return elapsed
+
+
+def _tool_key(tool: BaseTool, tool_context: ToolContext) -> Tuple[str, str]:
+    return tool.name, tool_context.function_call_id or ""
+
+
+def _observe_tool(tool: BaseTool, tool_context: ToolContext, outcome: str) -> None:
+    with _tool_started_lock:
+        started = _tool_started.pop(_tool_key(tool, tool_context), None)
+    if started is not None:
+        TOOL_SECONDS.observe(time.perf_counter() - started, tool=tool.name, outcome=outcome)
+
+
+def before_tool(tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext) -> Optional[Dict]:
+    """`before_tool_callback` starting the tool timer."""
+    with _tool_started_lock:
+        _tool_started[_tool_key(tool, tool_context)] = time.perf_counter()
+        while len(_tool_started) > MAX_TRACKED_TOOL_CALLS:
+            _tool_started.popitem(last=False)
+    return None
+
+
+def after_tool(
+    tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, tool_response: Dict
+) -> Optional[Dict]:
+    """`after_tool_callback` recording the tool's execution time."""
+    outcome = "success"
+    if isinstance(tool_response, dict) and tool_response.get("status") == "error":
+        outcome = "error"
+    _observe_tool(tool, tool_context, outcome)
+    return None
+
+
+def on_tool_error(
+    tool: BaseTool, args: Dict[str, Any], tool_context: ToolContext, error: Exception
+) -> Optional[Dict]:
+    """`on_tool_error_callback` recording the time of a tool that raised."""
+    _observe_tool(tool, tool_context, "exception")
+    # None lets the error propagate as before
+    return None
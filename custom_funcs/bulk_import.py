@@ -0,0 +1,179 @@
+"""
+Bulk registration import from streamed CSV or NDJSON.
+
+Rows are parsed one at a time from the request stream, validated, and the
+valid ones are forwarded to Supabase in batches of concurrent requests, so the
+upload is never held in memory as a whole.
+
+Input is decoded line by line, so bytes that aren't UTF-8 or a malformed
+CSV record only fail their own row; the import goes on and the summary
+covers every row.
+"""
+
+import codecs
+import csv
+import json
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import IO, Any, Callable, Dict, Iterator, List, Tuple
+
+from config import BULK_IMPORT_BATCH_SIZE, BULK_IMPORT_CONCURRENCY, BULK_IMPORT_MAX_REPORTED_ERRORS
+from custom_funcs.supabase_client import create_user
+
+CSV_CONTENT_TYPES = {"text/csv"}
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl"}
+
+# (row number, parsed row or None, parse error or None)
+ParsedRow = Tuple[int, Any, str]
+
+
+class _Utf8Lines:
+    """Iterator over the lines of a byte stream, decoded one at a time.
+
+    A line that isn't valid UTF-8 raises UnicodeDecodeError from `__next__`
+    without ending the iteration, so the reader can report it and go on.
+    """
+
+    def __init__(self, stream: IO[bytes]):
+        self._lines = iter(stream)
+        self._first = True
+
+    def __iter__(self) -> "_Utf8Lines":
+        return self
+
+    def __next__(self) -> str:
+        line = next(self._lines)
+        if self._first:
+            # Spreadsheet exports often put a byte order mark before the header
+            self._first = False
+            line = line.removeprefix(codecs.BOM_UTF8)
+        return line.decode("utf-8")
+
+
+def iter_csv_rows(stream: IO[bytes]) -> Iterator[ParsedRow]:
+    """Yield rows of a CSV stream whose first line holds the field names."""
+    reader = csv.DictReader(_Utf8Lines(stream))
+    try:
+        reader.fieldnames
+    except (UnicodeDecodeError, csv.Error) as exc:
+        # Without field names no row can be read
+        yield 0, None, f"Unreadable header row: {exc}"
+        return
+
+    row_number = 0
+    while True:
+        row_number += 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except UnicodeDecodeError as exc:
+            yield row_number, None, f"Not valid UTF-8: {exc}"
+            continue
+        except csv.Error as exc:
+            yield row_number, None, f"Invalid CSV: {exc}"
+            continue
+        if None in row:
+            yield row_number, None, "Row has more values than the header"
+            continue
+        yield row_number, row, ""
+
+
+def iter_ndjson_rows(stream: IO[bytes]) -> Iterator[ParsedRow]:
+    """Yield one JSON object per non-empty line of an NDJSON stream."""
+    row_number = 0
+    lines = _Utf8Lines(stream)
+    while True:
+        try:
+            line = next(lines)
+        except StopIteration:
+            return
+        except UnicodeDecodeError as exc:
+            row_number += 1
+            yield row_number, None, f"Not valid UTF-8: {exc}"
+            continue
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield row_number, None, f"Invalid JSON: {exc}"
+            continue
+        if not isinstance(row, dict):
+            yield row_number, None, "Each line must be a JSON object"
+            continue
+        yield row_number, row, ""
+
+
+def import_registrations(
+    rows: Iterator[ParsedRow],
+    validate: Callable[[Dict[str, Any]], Tuple[bool, str]],
+    sender: Callable[[Dict[str, Any]], Dict[str, Any]] = create_user,
+    batch_size: int = BULK_IMPORT_BATCH_SIZE,
+    concurrency: int = BULK_IMPORT_CONCURRENCY,
+    max_reported_errors: int = BULK_IMPORT_MAX_REPORTED_ERRORS,
+) -> Dict[str, Any]:
+    """Validate and forward streamed rows, returning a summary with per-row errors.
+
+    `validate` has the same contract as the single registration endpoint:
+    it returns (is_valid, error_message).
+    """
+    started = time.perf_counter()
+    summary = {
+        "rows_total": 0,
+        "rows_invalid": 0,
+        "rows_sent": 0,
+        "rows_failed": 0,
+    }
+    errors: List[Dict[str, Any]] = []
+
+    def report(row_number: int, error: str) -> None:
+        # Keep the response bounded however broken the upload is
+        if len(errors) < max_reported_errors:
+            errors.append({"row": row_number, "error": error})
+
+    def collect(futures: List[Tuple[int, Future]]) -> None:
+        wait([future for _, future in futures])
+        for row_number, future in futures:
+            try:
+                result = future.result()
+            except Exception as exc:
+                result = {"success": False, "error": f"Unexpected error: {exc}"}
+            if result.get("success"):
+                summary["rows_sent"] += 1
+            else:
+                summary["rows_failed"] += 1
+                report(row_number, result.get("error", "Registration failed"))
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bulk-import") as executor:
+        batch: List[Tuple[int, Future]] = []
+        for row_number, row, parse_error in rows:
+            summary["rows_total"] += 1
+            if parse_error:
+                summary["rows_invalid"] += 1
+                report(row_number, parse_error)
+                continue
+
+            # Empty cells mean "not answered", so required-field checks see them as missing
+            payload = {key: value for key, value in row.items() if value not in ("", None)}
+            is_valid, error_msg = validate(payload)
+            if not is_valid:
+                summary["rows_invalid"] += 1
+                report(row_number, error_msg)
+                continue
+
+            batch.append((row_number, executor.submit(sender, payload)))
+            if len(batch) >= batch_size:
+                # At most one batch is in flight, which bounds memory use
+                collect(batch)
+                batch = []
+
+        if batch:
+            collect(batch)
+
+    elapsed = time.perf_counter() - started
+    summary["elapsed_seconds"] = round(elapsed, 3)
+    summary["rows_per_second"] = round(summary["rows_total"] / elapsed, 1) if elapsed > 0 else 0.0
+    summary["errors"] = errors
+    return summary
@@ -0,0 +1,269 @@
+"""
+Process-wide cache for the onboarding question schema.
+
+The admin panel (Google Sheet) is slow to reach and quota limited, so every
+reader in the process (the index page, `/retrieve_all_questions`, the
+registration endpoint) goes through a single shared cache instead of calling
+`read_sheet_retrieve_questions()` directly.
+
+Behaviour:
+    - Fresh copy (younger than the TTL): served straight from memory.
+    - Stale copy: served immediately while one background thread refreshes it.
+    - No copy yet (cold start): the caller waits, but concurrent misses are
+      collapsed into a single Sheets fetch.
+    - Refreshes first compare the sheet revision; an unchanged sheet is not
+      downloaded or parsed again.
+
+The last good schema is also written to a local snapshot file and loaded when
+the process starts, so a cold start serves questions in milliseconds and
+keeps working while Google Sheets is slow or down; the snapshot is replaced
+as soon as a fresh fetch succeeds.
+
+Every published schema gets a version (content hash). The most recent
+versions are kept, so a user session only needs to store the version it was
+shown and can be validated against exactly that schema later on.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import (
+    QUESTION_CACHE_TTL_SECONDS,
+    QUESTION_CACHE_ERROR_RETRY_SECONDS,
+    QUESTION_SCHEMA_VERSIONS_KEPT,
+    QUESTION_SNAPSHOT_PATH,
+)
+from custom_funcs.read_sheet import read_sheet_retrieve_questions
+from custom_funcs.validation import schema_version
+
+logger = logging.getLogger(__name__)
+
+
+def parse_sheet_values(values: List[List[str]]) -> List[Dict[str, Any]]:
+    """Convert raw sheet rows (header row first) into question dictionaries."""
+    if not values or len(values) < 2:  # Need at least header row + 1 data row
+        return []
+
+    headers = values[0]
+    questions: List[Dict[str, Any]] = []
+    for row in values[1:]:
+        if not row:  # Skip empty rows
+            continue
+        # Use empty string if row doesn't have enough columns
+        question = {headers[i]: row[i] if i < len(row) else '' for i in range(len(headers))}
+        questions.append(question)
+    return questions
+
+
+class QuestionSchemaCache:
+    """
+    TTL cache with single-flight refresh and stale-while-revalidate semantics.
+
+    The returned question list is shared between all readers and must be
+    treated as read-only.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[Optional[str]], Dict[str, Any]] = read_sheet_retrieve_questions,
+        ttl_seconds: float = QUESTION_CACHE_TTL_SECONDS,
+        error_retry_seconds: float = QUESTION_CACHE_ERROR_RETRY_SECONDS,
+        snapshot_path: Optional[str] = QUESTION_SNAPSHOT_PATH,
+    ):
+        self._loader = loader
+        self._ttl_seconds = ttl_seconds
+        self._error_retry_seconds = error_retry_seconds
+
+        # Guards the cached state below
+        self._lock = threading.Lock()
+        # Held for the duration of a Sheets fetch so only one runs at a time
+        self._fetch_lock = threading.Lock()
+
+        self._questions: Optional[List[Dict[str, Any]]] = None
+        self._version: Optional[str] = None
+        # Sheet revision of the published copy, lets the loader skip unchanged sheets
+        self._revision: Optional[str] = None
+        # Recently published schemas by version, oldest first
+        self._versions: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._expires_at = 0.0
+        self._refreshing = False
+        self.last_error: Optional[str] = None
+
+        self._snapshot_path = snapshot_path
+        if snapshot_path:
+            self._load_snapshot()
+
+    def get_questions(self) -> List[Dict[str, Any]]:
+        """Return the cached questions, refreshing them if needed."""
+        with self._lock:
+            questions = self._questions
+            is_stale = time.monotonic() >= self._expires_at
+            recently_failed = self.last_error is not None
+
+        if questions is None:
+            if recently_failed and not is_stale:
+                # Cold start and the sheet just failed: don't hammer it on every request
+                return []
+            return self._fetch_blocking()
+
+        if is_stale:
+            self.refresh_in_background()
+        return questions
+
+    def get_snapshot(self) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """Return (schema version, questions); the version is None if there are no questions."""
+        questions = self.get_questions()
+        with self._lock:
+            if questions and questions is self._questions:
+                return self._version, questions
+        return (schema_version(questions) if questions else None), questions
+
+    def get_version(self, version: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        """Return the questions of a recently published schema version, if still kept."""
+        if not version:
+            return None
+        with self._lock:
+            return self._versions.get(version)
+
+    def refresh_in_background(self) -> None:
+        """Start a background refresh unless one is already running."""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        threading.Thread(
+            target=self._background_refresh,
+            name="question-cache-refresh",
+            daemon=True,
+        ).start()
+
+    def invalidate(self) -> None:
+        """Mark the cached copy as stale so the next read triggers a refresh."""
+        with self._lock:
+            self._expires_at = 0.0
+
+    def _fetch_blocking(self) -> List[Dict[str, Any]]:
+        with self._fetch_lock:
+            # Another thread may have filled the cache while we were waiting
+            with self._lock:
+                if self._questions is not None:
+                    return self._questions
+            self._refresh()
+            with self._lock:
+                return self._questions or []
+
+    def _background_refresh(self) -> None:
+        try:
+            with self._fetch_lock:
+                self._refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _refresh(self) -> None:
+        """Fetch from the sheet and swap the cached copy. Caller holds `_fetch_lock`.
+
+        The new copy is parsed and sorted completely before it is published with
+        a single swap, so readers see either the old or the new schema.
+        """
+        with self._lock:
+            # Only skip the download if we actually have something to keep serving
+            last_revision = self._revision if self._questions is not None else None
+        response = self._loader(last_revision)
+
+        if response.get('status') == 'unchanged':
+            with self._lock:
+                self._expires_at = time.monotonic() + self._ttl_seconds
+                self.last_error = None
+            return
+
+        questions: List[Dict[str, Any]] = []
+        error_message = None
+
+        if response.get('status') != 'success':
+            error_message = response.get('error_message', 'Unknown error occurred')
+        else:
+            questions = parse_sheet_values(response.get('values', []))
+            if not questions:
+                error_message = "No questions found."
+
+        with self._lock:
+            if error_message:
+                # Keep serving whatever we have and retry a bit later
+                self.last_error = error_message
+                self._expires_at = time.monotonic() + self._error_retry_seconds
+                logger.warning("Question schema refresh failed: %s", error_message)
+                return
+
+            self._expires_at = time.monotonic() + self._ttl_seconds
+            self.last_error = None
+            self._revision = response.get('revision')
+
+            version = schema_version(questions)
+            if version == self._version:
+                # Unchanged: keep the published list so readers' caches stay valid
+                return
+            self._publish(version, questions)
+
+        # Still under _fetch_lock, so snapshot writes never interleave
+        if self._snapshot_path:
+            self._save_snapshot(version, response.get('revision'), questions)
+
+    def _publish(self, version: str, questions: List[Dict[str, Any]]) -> None:
+        """Make `questions` the serving copy. Caller holds `_lock`."""
+        self._questions = questions
+        self._version = version
+        self._versions[version] = questions
+        while len(self._versions) > QUESTION_SCHEMA_VERSIONS_KEPT:
+            self._versions.popitem(last=False)
+
+    def _load_snapshot(self) -> None:
+        """Serve the last good schema from disk until the first fresh fetch succeeds."""
+        try:
+            with open(self._snapshot_path, encoding='utf-8') as snapshot_file:
+                snapshot = json.load(snapshot_file)
+            questions = snapshot['questions']
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as exc:
+            logger.warning("Ignoring unreadable question snapshot %s: %s", self._snapshot_path, exc)
+            return
+
+        if not questions:
+            return
+        with self._lock:
+            self._publish(snapshot.get('version') or schema_version(questions), questions)
+            self._revision = snapshot.get('revision')
+            # Stale right away: the first read triggers a background refresh
+            self._expires_at = 0.0
+
+    def _save_snapshot(self, version: str, revision: Optional[str], questions: List[Dict[str, Any]]) -> None:
+        snapshot = {
+            'version': version,
+            'revision': revision,
+            'saved_at': time.time(),
+            'questions': questions,
+        }
+        tmp_path = f"{self._snapshot_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as snapshot_file:
+                json.dump(snapshot, snapshot_file)
+            # Atomic on POSIX and Windows: readers never see a half-written snapshot
+            os.replace(tmp_path, self._snapshot_path)
+        except OSError as exc:
+            logger.warning("Could not write question snapshot %s: %s", self._snapshot_path, exc)
+
+
+# Shared instance used by the whole process
+question_cache = QuestionSchemaCache()
+
+
+def get_questions() -> List[Dict[str, Any]]:
+    """Return the current question schema from the shared cache."""
+    return question_cache.get_questions()
@@ -1,87 +1,200 @@
+import json
+import logging
 import os.path
+import threading
+import time
+from typing import List, Optional
 
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from google.oauth2 import service_account
 
+from config import QUESTION_SHEET_SOURCE, QUESTION_SHEET_FIXTURE_PATH
+from custom_funcs.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
 # The ID and range of a sample spreadsheet.
 ## The sheet is private and contains questions to be loaded and asked during the onboarding process.
 SAMPLE_SPREADSHEET_ID = "1thatsasecretsheetM"
 SAMPLE_RANGE_NAME = "questions!A1:Z"
 SERVICE_ACCOUNT_FILE = './google_sheet_credentials.json'
-SCOPES = ['https://www.googleapis.com/auth/spreadsheets'] # Or 'https://www.googleapis.com/auth/spreadsheets.readonly' for read-only
-
+SHEET_FETCH_SECONDS = Histogram(
+    "sheet_fetch_seconds", "Duration of question sheet reads, revision check included", ["status"]
+)
 
-def read_sheet_retrieve_questions() -> dict:
-    """
-    Reads questions from the Google Sheet for the onboarding process.
+SCOPES = [
+    'https://www.googleapis.com/auth/spreadsheets', # Or 'https://www.googleapis.com/auth/spreadsheets.readonly' for read-only
+    'https://www.googleapis.com/auth/drive.metadata.readonly', # Revision metadata for change detection
+]
 
-    Only returns questions whose `is_active` column indicates that the
-    question is active. Rows where `is_active` is empty or evaluates to
-    a falsy value (anything other than 'true', '1', 'yes', or 'y'
-    case-insensitively) are filtered out.
 
-    Returns:
-        dict: {"status": "success", "values": list[list[str]]} on success
-              {"status": "error", "error_message": str} on failure.
+class GoogleSheetsClient:
     """
-    creds = None
-    try:
-        creds = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE, scopes=SCOPES
-        )
+    Reads the admin sheet through the Sheets API.
 
-        service = build("sheets", "v4", credentials=creds)
+    Credentials and API clients are built once and reused. The revision check
+    uses the Drive file metadata (`version`), which is much cheaper than
+    downloading the range.
+    """
 
-        # Call the Sheets API
-        sheet = service.spreadsheets()
+    def __init__(self, spreadsheet_id: str = SAMPLE_SPREADSHEET_ID, range_name: str = SAMPLE_RANGE_NAME):
+        self._spreadsheet_id = spreadsheet_id
+        self._range_name = range_name
+        self._lock = threading.Lock()
+        self._sheets = None
+        self._drive = None
+
+    def _services(self):
+        with self._lock:
+            if self._sheets is None:
+                creds = service_account.Credentials.from_service_account_file(
+                    SERVICE_ACCOUNT_FILE, scopes=SCOPES
+                )
+                self._sheets = build("sheets", "v4", credentials=creds, cache_discovery=False)
+                self._drive = build("drive", "v3", credentials=creds, cache_discovery=False)
+            return self._sheets, self._drive
+
+    def get_revision(self) -> Optional[str]:
+        """Return the sheet's current revision, or None if it can't be determined."""
+        try:
+            _, drive = self._services()
+            metadata = (
+                drive.files()
+                .get(fileId=self._spreadsheet_id, fields="version,modifiedTime")
+                .execute()
+            )
+        except Exception as exc:
+            # Missing Drive access only costs us the shortcut, not the data
+            logger.warning("Sheet revision check failed, falling back to a full read: %s", exc)
+            return None
+        return metadata.get("version") or metadata.get("modifiedTime")
+
+    def get_values(self) -> List[List[str]]:
+        sheets, _ = self._services()
         result = (
-            sheet.values()
-            .get(spreadsheetId=SAMPLE_SPREADSHEET_ID, range=SAMPLE_RANGE_NAME)
+            sheets.spreadsheets().values()
+            .get(spreadsheetId=self._spreadsheet_id, range=self._range_name)
             .execute()
         )
-        values = result.get("values", [])
+        return result.get("values", [])
+
+
+class FixtureSheetsClient:
+    """
+    Offline stand-in for the Sheets API backed by a local JSON file.
+
+    The file holds {"values": [[header...], [row...], ...]} exactly like the
+    Sheets API response; its modification time and size act as the revision.
+    """
+
+    def __init__(self, path: str = QUESTION_SHEET_FIXTURE_PATH):
+        self._path = path
+
+    def get_revision(self) -> Optional[str]:
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def get_values(self) -> List[List[str]]:
+        with open(self._path, encoding="utf-8") as fixture:
+            return json.load(fixture).get("values", [])
+
 
-        if not values:
-            return {"status": "error", "error_message": "No data found."}
+_client = None
 
-        # Identify the 'is_active' column index
-        headers = [h.strip().lower() for h in values[0]]
-        if "is_active" not in headers:
-            return {
-                "status": "error",
-                "error_message": "'is_active' column not found in sheet.",
-            }
 
-        active_idx = headers.index("is_active")
+def get_sheets_client():
+    """Return the configured sheet client ('google' by default, or 'fixture')."""
+    global _client
+    if _client is None:
+        if QUESTION_SHEET_SOURCE == 'fixture':
+            _client = FixtureSheetsClient()
+        else:
+            _client = GoogleSheetsClient()
+    return _client
 
-        truthy_set = {"true", "1", "yes", "y"}
 
-        # Keep only active rows
-        active_rows = [
-            row
-            for row in values[1:]
-            if len(row) > active_idx
-            and str(row[active_idx]).strip().lower() in truthy_set
-        ]
+def _filter_and_sort(values: List[List[str]]) -> dict:
+    """Keep active rows and sort them by `question_order_priority`."""
+    if not values:
+        return {"status": "error", "error_message": "No data found."}
 
-        # Identify ordering column
-        priority_idx = headers.index("question_order_priority") if "question_order_priority" in headers else None
+    # Identify the 'is_active' column index
+    headers = [h.strip().lower() for h in values[0]]
+    if "is_active" not in headers:
+        return {
+            "status": "error",
+            "error_message": "'is_active' column not found in sheet.",
+        }
 
-        if priority_idx is not None:
-            def _priority_val(row):
-                try:
-                    return int(row[priority_idx])
-                except (ValueError, IndexError):
-                    # Treat missing/invalid values as very low priority (last)
-                    return float("inf")
+    active_idx = headers.index("is_active")
 
-            # Python sort is stable, so equal priorities retain sheet order
-            active_rows.sort(key=_priority_val)
+    truthy_set = {"true", "1", "yes", "y"}
 
-        filtered_values = [values[0]] + active_rows
+    # Keep only active rows
+    active_rows = [
+        row
+        for row in values[1:]
+        if len(row) > active_idx
+        and str(row[active_idx]).strip().lower() in truthy_set
+    ]
+
+    # Identify ordering column
+    priority_idx = headers.index("question_order_priority") if "question_order_priority" in headers else None
+
+    if priority_idx is not None:
+        def _priority_val(row):
+            try:
+                return int(row[priority_idx])
+            except (ValueError, IndexError):
+                # Treat missing/invalid values as very low priority (last)
+                return float("inf")
+
+        # Python sort is stable, so equal priorities retain sheet order
+        active_rows.sort(key=_priority_val)
+
+    filtered_values = [values[0]] + active_rows
+
+    return {"status": "success", "values": filtered_values}
+
+
+def read_sheet_retrieve_questions(last_revision: Optional[str] = None, client=None) -> dict:
+    """
+    Reads questions from the Google Sheet for the onboarding process.
+
+    Only returns questions whose `is_active` column indicates that the
+    question is active. Rows where `is_active` is empty or evaluates to
+    a falsy value (anything other than 'true', '1', 'yes', or 'y'
+    case-insensitively) are filtered out.
+
+    Args:
+        last_revision: Revision of the copy the caller already has. If the sheet
+            still has this revision, nothing is downloaded.
+        client: Sheet client to use; defaults to the configured one.
+
+    Returns:
+        dict: {"status": "success", "values": list[list[str]], "revision": str | None} on success
+              {"status": "unchanged", "revision": str} if the sheet still has `last_revision`
+              {"status": "error", "error_message": str} on failure.
+    """
+    started = time.perf_counter()
+    response = _retrieve_questions(last_revision, client or get_sheets_client())
+    SHEET_FETCH_SECONDS.observe(time.perf_counter() - started, status=response["status"])
+    return response
+
+
+def _retrieve_questions(last_revision: Optional[str], client) -> dict:
+    try:
+        revision = client.get_revision()
+        if last_revision is not None and revision == last_revision:
+            return {"status": "unchanged", "revision": revision}
 
-        return {"status": "success", "values": filtered_values}
+        response = _filter_and_sort(client.get_values())
+        response["revision"] = revision
+        return response
 
     except HttpError as err:
         return {"status": "error", "error_message": str(err)}
@@ -0,0 +1,254 @@
+"""
+Write-behind queue for user registrations.
+
+Registrations are stored in a local SQLite file and acknowledged immediately
+with a registration id; a dispatcher thread claims them in batches and worker
+threads forward them to the Supabase edge function via `create_user`.
+
+Each registration carries an idempotency key (for the agent, derived from the
+chat session id), so a retried tool call or a double-submitted form maps to
+the existing registration instead of creating a second user. Submitting a
+known key again queues a failed registration once more, and a registration
+not yet delivered picks up the new payload, e.g. after the user corrected a
+taken username in the chat.
+
+States: pending -> processing -> succeeded | failed (pending again while
+retries remain, or when resubmitted).
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from config import (
+    REGISTRATION_QUEUE_PATH,
+    REGISTRATION_QUEUE_WORKERS,
+    REGISTRATION_QUEUE_BATCH_SIZE,
+    REGISTRATION_QUEUE_MAX_ATTEMPTS,
+    REGISTRATION_QUEUE_POLL_SECONDS,
+)
+from custom_funcs.supabase_client import create_user
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+PROCESSING = "processing"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrations (
+    id TEXT PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    revision INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS registrations_status_idx ON registrations (status, updated_at);
+"""
+
+
+def _sent_idempotency_key(idempotency_key: str, revision: int) -> str:
+    """Key sent downstream; a changed payload is a different request for the edge function."""
+    return idempotency_key if revision == 0 else f"{idempotency_key}:r{revision}"
+
+
+class RegistrationQueue:
+    """Durable SQLite-backed queue flushed to Supabase by worker threads."""
+
+    def __init__(
+        self,
+        db_path: str = REGISTRATION_QUEUE_PATH,
+        workers: int = REGISTRATION_QUEUE_WORKERS,
+        batch_size: int = REGISTRATION_QUEUE_BATCH_SIZE,
+        max_attempts: int = REGISTRATION_QUEUE_MAX_ATTEMPTS,
+        poll_seconds: float = REGISTRATION_QUEUE_POLL_SECONDS,
+        sender: Callable[..., Dict[str, Any]] = create_user,
+    ):
+        self._batch_size = batch_size
+        self._max_attempts = max_attempts
+        self._poll_seconds = poll_seconds
+        self._sender = sender
+
+        # One connection shared by all threads; the lock serializes access to it
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(registrations)")}
+        if "revision" not in columns:
+            # Queue files created before resubmissions were supported
+            self._db.execute("ALTER TABLE registrations ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="registration-worker")
+        self._wakeup = threading.Event()
+        self._dispatcher: Optional[threading.Thread] = None
+
+    # ---------------- producer side ----------------
+
+    def enqueue(self, payload: Dict[str, Any], idempotency_key: str) -> Tuple[str, str]:
+        """Store a registration and return (registration_id, status).
+
+        A known idempotency key maps to the existing registration. If that one
+        failed, it is queued again with `payload`; if it is still pending, a
+        changed `payload` replaces the stored one. A registration that is being
+        sent or already succeeded is left alone and its status returned.
+        """
+        now = time.time()
+        registration_id = str(uuid4())
+        payload_json = json.dumps(payload, sort_keys=True)
+        with self._db_lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO registrations "
+                "(id, idempotency_key, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (registration_id, idempotency_key, payload_json, PENDING, now, now),
+            )
+            queued = cursor.rowcount == 1
+            status = PENDING
+            if not queued:
+                registration_id, status, stored_payload = self._db.execute(
+                    "SELECT id, status, payload FROM registrations WHERE idempotency_key = ?",
+                    (idempotency_key,),
+                ).fetchone()
+                changed = stored_payload != payload_json
+                if status == FAILED or (status == PENDING and changed):
+                    # A failed registration starts over with a fresh retry budget
+                    self._db.execute(
+                        "UPDATE registrations SET payload = ?, status = ?, "
+                        "attempts = CASE WHEN status = ? THEN 0 ELSE attempts END, "
+                        "revision = revision + ?, result = NULL, updated_at = ? WHERE id = ?",
+                        (payload_json, PENDING, FAILED, int(changed), now, registration_id),
+                    )
+                    queued, status = True, PENDING
+
+        if queued:
+            self._wakeup.set()
+        return registration_id, status
+
+    def get_status(self, registration_id: str) -> Optional[Dict[str, Any]]:
+        """Return the current state of a registration, or None if unknown."""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT status, attempts, result FROM registrations WHERE id = ?",
+                (registration_id,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        status, attempts, result = row
+        return {
+            "registration_id": registration_id,
+            "status": status,
+            "attempts": attempts,
+            "result": json.loads(result) if result else None,
+        }
+
+    # ---------------- consumer side ----------------
+
+    def start(self) -> None:
+        """Start the dispatcher thread (idempotent)."""
+        if self._dispatcher is not None:
+            return
+
+        # Registrations claimed by a previous process that died mid-flight
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE registrations SET status = ? WHERE status = ?", (PENDING, PROCESSING)
+            )
+
+        self._dispatcher = threading.Thread(
+            target=self._dispatch_forever, name="registration-dispatcher", daemon=True
+        )
+        self._dispatcher.start()
+
+    def _dispatch_forever(self) -> None:
+        while True:
+            try:
+                batch = self._claim_batch()
+            except Exception:
+                logger.exception("Failed to claim registrations")
+                batch = []
+
+            if batch:
+                # Send the batch concurrently and wait, so a batch never overlaps the next claim
+                list(self._executor.map(self._process, batch))
+                continue
+
+            self._wakeup.wait(self._poll_seconds)
+            self._wakeup.clear()
+
+    def _claim_batch(self) -> List[Tuple[str, str, str, int, int]]:
+        with self._db_lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # Retried registrations wait poll_seconds per previous attempt
+                rows = self._db.execute(
+                    "SELECT id, idempotency_key, payload, attempts, revision FROM registrations "
+                    "WHERE status = ? AND updated_at + attempts * ? <= ? "
+                    "ORDER BY updated_at LIMIT ?",
+                    (PENDING, self._poll_seconds, time.time(), self._batch_size),
+                ).fetchall()
+                self._db.executemany(
+                    "UPDATE registrations SET status = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ?",
+                    [(PROCESSING, time.time(), row[0]) for row in rows],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _process(self, row: Tuple[str, str, str, int, int]) -> None:
+        registration_id, idempotency_key, payload, attempts, revision = row
+        try:
+            result = self._sender(
+                json.loads(payload), idempotency_key=_sent_idempotency_key(idempotency_key, revision)
+            )
+        except Exception as exc:
+            result = {"success": False, "error": f"Unexpected error: {exc}", "status_code": 500}
+
+        if result.get("success"):
+            status = SUCCEEDED
+        elif result.get("retryable") and attempts + 1 < self._max_attempts:
+            # Refused before anything was created (connection error, 429, 503)
+            status = PENDING
+        else:
+            # Client errors won't succeed on retry, and resending after a 5xx or a
+            # timeout could create the user twice
+            status = FAILED
+
+        if status != SUCCEEDED:
+            logger.warning(
+                "Registration %s attempt %d: %s", registration_id, attempts + 1, result.get("error")
+            )
+
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE registrations SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                (status, json.dumps(result), time.time(), registration_id),
+            )
+
+
+_queue: Optional[RegistrationQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_registration_queue() -> RegistrationQueue:
+    """Return the process-wide registration queue, starting it on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = RegistrationQueue()
+            _queue.start()
+    return _queue
@@ -0,0 +1,76 @@
+"""
+Schema providers used by the agent tools to obtain the onboarding questions.
+
+The default provider reads the shared in-process question cache, so the agent
+and the Flask routes share one parsed question list and a tool call costs a
+memory lookup. The HTTP provider is kept for deployments where the agent runs
+apart from the Flask app and has to call `/retrieve_all_questions` remotely.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from config import QUESTION_SCHEMA_PROVIDER, QUESTION_SCHEMA_API_URL
+from custom_funcs.question_cache import QuestionSchemaCache, question_cache
+
+
+class SchemaUnavailableError(Exception):
+    """Raised when a provider cannot return any questions."""
+
+
+class SchemaProvider:
+    """Interface for anything that can return the parsed question list."""
+
+    def get_questions(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class CachedSchemaProvider(SchemaProvider):
+    """Reads questions from the process-wide question cache."""
+
+    def __init__(self, cache: QuestionSchemaCache = question_cache):
+        self._cache = cache
+
+    def get_questions(self) -> List[Dict[str, Any]]:
+        questions = self._cache.get_questions()
+        if not questions:
+            raise SchemaUnavailableError(self._cache.last_error or "No questions available.")
+        return questions
+
+
+class HttpSchemaProvider(SchemaProvider):
+    """Fetches questions from a remote `/retrieve_all_questions` endpoint."""
+
+    def __init__(self, base_url: str, timeout: int = 5):
+        self._base_url = base_url.rstrip('/')
+        self._timeout = timeout
+
+    def get_questions(self) -> List[Dict[str, Any]]:
+        resp = requests.get(f"{self._base_url}/retrieve_all_questions", timeout=self._timeout)
+        resp.raise_for_status()
+        data = resp.json()
+
+        if not data.get("success"):
+            raise SchemaUnavailableError(data.get("error", "Unknown error"))
+        return data.get("questions", [])
+
+
+_provider: Optional[SchemaProvider] = None
+
+
+def get_schema_provider() -> SchemaProvider:
+    """Return the configured provider ('local' by default, or 'http')."""
+    global _provider
+    if _provider is None:
+        if QUESTION_SCHEMA_PROVIDER == 'http':
+            _provider = HttpSchemaProvider(QUESTION_SCHEMA_API_URL)
+        else:
+            _provider = CachedSchemaProvider()
+    return _provider
+
+
+def set_schema_provider(provider: SchemaProvider) -> None:
+    """Override the provider, e.g. to plug in a different admin panel."""
+    global _provider
+    _provider = provider
@@ -1,17 +1,149 @@
 """
 Helper utilities for interacting with Supabase edge functions.
+
+All calls share one pooled `requests.Session`, so registrations reuse
+keep-alive connections to the edge function. Requests that surely created
+nothing (connection failures, 429 and 503 responses) are retried with
+exponential backoff and jitter. Connection and retry counters are
+available from `get_http_client_stats()`.
 """
 
 import os
+import threading
+import time
 from typing import Any, Dict, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.retry import Retry
+
+from config import (
+    SUPABASE_POOL_SIZE,
+    SUPABASE_MAX_RETRIES,
+    SUPABASE_RETRY_BACKOFF_SECONDS,
+)
+from custom_funcs.metrics import Histogram, register_collector
 
 
 SUPABASE_ONBOARD_USER_URL = os.getenv("SUPABASE_ONBOARD_USER_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-def create_user(user_data: Dict[str, Any], timeout: int = 10) -> Dict[str, Any]:
+# Responses worth retrying: the request was refused before any work was done. A 500,
+# 502, 504 or read timeout may come after the user was created, so those aren't retried.
+RETRY_STATUS_CODES = (429, 503)
+
+
+# ---------------- HTTP client stats ----------------
+
+_stats_lock = threading.Lock()
+_stats = {
+    "requests": 0,  # attempts sent over the wire, retries included
+    "connections_opened": 0,  # new TCP(+TLS) connections
+    "retries": 0,
+}
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_http_client_stats() -> Dict[str, int]:
+    """Return connection-reuse and retry counters of the shared Supabase client."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["connections_reused"] = max(stats["requests"] - stats["connections_opened"], 0)
+    return stats
+
+
+def _collect_http_client_stats():
+    stats = get_http_client_stats()
+    yield (
+        "supabase_http_events_total",
+        "counter",
+        "Connection and retry counters of the pooled Supabase HTTP client",
+        [({"event": name}, value) for name, value in sorted(stats.items())],
+    )
+
+
+register_collector(_collect_http_client_stats)
+
+CREATE_USER_SECONDS = Histogram(
+    "supabase_create_user_seconds", "Duration of create-user edge function calls, retries included", ["outcome"]
+)
+
+
+class _CountingRetry(Retry):
+    def increment(self, *args, **kwargs):
+        new_retry = super().increment(*args, **kwargs)
+        _count("retries")
+        return new_retry
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count("connections_opened")
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        _count("requests")
+        return super()._make_request(*args, **kwargs)
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count("connections_opened")
+        return super()._new_conn()
+
+    def _make_request(self, *args, **kwargs):
+        _count("requests")
+        return super()._make_request(*args, **kwargs)
+
+
+class _CountingHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+def _build_session() -> requests.Session:
+    retry = _CountingRetry(
+        total=SUPABASE_MAX_RETRIES,
+        # Only failures before the request reached the edge function, plus RETRY_STATUS_CODES
+        connect=SUPABASE_MAX_RETRIES,
+        read=0,
+        other=0,
+        status_forcelist=RETRY_STATUS_CODES,
+        # The edge function is called with POST, which urllib3 doesn't retry by default
+        allowed_methods=frozenset({"POST"}),
+        backoff_factor=SUPABASE_RETRY_BACKOFF_SECONDS,
+        backoff_jitter=SUPABASE_RETRY_BACKOFF_SECONDS,
+        respect_retry_after_header=True,
+        # Hand the last response back so raise_for_status reports the real status
+        raise_on_status=False,
+    )
+    adapter = _CountingHTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=SUPABASE_POOL_SIZE,
+        max_retries=retry,
+    )
+    http = requests.Session()
+    http.mount("https://", adapter)
+    http.mount("http://", adapter)
+    return http
+
+
+# Shared by /api/register and the agent's register_user_in_db tool
+_http = _build_session()
+
+def create_user(
+    user_data: Dict[str, Any], timeout: int = 10, idempotency_key: Optional[str] = None
+) -> Dict[str, Any]:
     """
     Call the Supabase `create-user` edge function with the provided registration payload.
 
@@ -19,6 +151,8 @@ def create_user(user_data: Dict[str, Any], timeout: int = 10) -> Dict[str, Any]:
         user_data: Dictionary containing the full registration payload collected from the
             onboarding form / agent.
         timeout: Optional request timeout in seconds.
+        idempotency_key: Optional key sent as the `Idempotency-Key` header so retried
+            submissions of the same registration can be recognized downstream.
     
     Example `user_data`:
     {'name': 'Adam', 
@@ -33,8 +167,32 @@ def create_user(user_data: Dict[str, Any], timeout: int = 10) -> Dict[str, Any]:
             - success (bool): Whether the request succeeded.
             - data (dict): Parsed JSON or raw text wrapped in a dict.
             - error (str, optional): Error message if the request failed.
-            - status_code (int): HTTP status code of the response.
+            - status_code (int): HTTP status code of the response; the edge function's
+              own code for 4xx errors, 502 for other failures.
+            - retryable (bool, on failure): True when nothing was created and sending
+              the same registration again later may succeed (see RETRY_STATUS_CODES).
     """
+    started = time.perf_counter()
+    result = _create_user(user_data, timeout, idempotency_key)
+    CREATE_USER_SECONDS.observe(
+        time.perf_counter() - started, outcome="success" if result.get("success") else "error"
+    )
+    return result
+
+
+def _never_sent(exc: requests.RequestException) -> bool:
+    """True when the request failed before reaching the edge function."""
+    if isinstance(exc, requests.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.ConnectionError) and exc.args:
+        # Refused or unresolvable; NewConnectionError is a ConnectTimeoutError in urllib3
+        return isinstance(getattr(exc.args[0], "reason", None), ConnectTimeoutError)
+    return False
+
+
+def _create_user(
+    user_data: Dict[str, Any], timeout: int, idempotency_key: Optional[str]
+) -> Dict[str, Any]:
     # Basic validation – ensure the payload is a non-empty dictionary
     if not isinstance(user_data, dict) or not user_data:
         return {
@@ -48,8 +206,10 @@ def create_user(user_data: Dict[str, Any], timeout: int = 10) -> Dict[str, Any]:
             "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
             "Content-Type": "application/json"
         }
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
 
-        response = requests.post(
+        response = _http.post(
             SUPABASE_ONBOARD_USER_URL,
             json=user_data,
             headers=headers,
@@ -57,10 +217,13 @@ def create_user(user_data: Dict[str, Any], timeout: int = 10) -> Dict[str, Any]:
         )
         response.raise_for_status()
     except requests.RequestException as exc:
+        upstream_status = exc.response.status_code if exc.response is not None else None
         return {
             "success": False,
             "error": f"Supabase request failed: {exc}",
-            "status_code": 502,
+            "status_code": upstream_status if upstream_status and upstream_status < 500 else 502,
+            "retryable": upstream_status in RETRY_STATUS_CODES
+            or (upstream_status is None and _never_sent(exc)),
         }
 
     try:
@@ -0,0 +1,178 @@
+"""
+Registration validators compiled from the question schema.
+
+Besides `questioned_entity` and `is_mandatory`, the admin sheet may define
+per-field constraints in these optional columns:
+
+    field_type      text (default) | email | number | integer | enum
+    validation_regex  regular expression the whole value must match
+    allowed_values  values accepted for enum fields, separated by '|' or ','
+    min_length / max_length  length bounds for the value
+
+Constraints are compiled once per schema version into a `RegistrationValidator`
+that both the form endpoints and the agent's `save_user_info` tool use, so
+invalid data is rejected locally instead of after an edge-function round trip.
+"""
+
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional, Pattern, Tuple
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+INTEGER_RE = re.compile(r"^[+-]?\d+$")
+NUMBER_RE = re.compile(r"^[+-]?(\d+(\.\d*)?|\.\d+)$")
+
+# Compiled validators kept for the most recent schema versions
+MAX_CACHED_VALIDATORS = 8
+
+
+def schema_version(questions: List[Dict[str, Any]]) -> str:
+    """Short content hash identifying a question schema."""
+    canonical = json.dumps(questions, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def is_blank(value: Any) -> bool:
+    """True for values that mean "not answered", like the empty fields the form posts."""
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _int_or_none(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class FieldRule:
+    """Constraints of a single questioned entity."""
+
+    __slots__ = ("entity", "field_type", "pattern", "allowed_values", "min_length", "max_length")
+
+    def __init__(self, question: Dict[str, Any]):
+        self.entity: str = question.get("questioned_entity")
+        field_type = (question.get("field_type") or "").strip().lower()
+        if not field_type:
+            # Same inference the form template uses for the input type
+            field_type = "email" if "email" in self.entity.lower() else "text"
+        self.field_type = field_type
+
+        regex = (question.get("validation_regex") or "").strip()
+        self.pattern: Optional[Pattern[str]] = re.compile(regex) if regex else None
+
+        raw_allowed = question.get("allowed_values") or ""
+        self.allowed_values: FrozenSet[str] = frozenset(
+            value.strip().lower() for value in re.split(r"[|,]", raw_allowed) if value.strip()
+        )
+        self.min_length = _int_or_none(question.get("min_length"))
+        self.max_length = _int_or_none(question.get("max_length"))
+
+    def check(self, value: Any) -> Optional[str]:
+        """Return an error message for an invalid value, None if it is valid."""
+        text = str(value).strip()
+
+        if self.min_length is not None and len(text) < self.min_length:
+            return f"must be at least {self.min_length} characters"
+        if self.max_length is not None and len(text) > self.max_length:
+            return f"must be at most {self.max_length} characters"
+
+        if self.field_type == "email" and not EMAIL_RE.match(text):
+            return "must be a valid email address"
+        if self.field_type == "integer" and not INTEGER_RE.match(text):
+            return "must be a whole number"
+        if self.field_type == "number" and not NUMBER_RE.match(text):
+            return "must be a number"
+        if self.allowed_values and text.lower() not in self.allowed_values:
+            return f"must be one of: {', '.join(sorted(self.allowed_values))}"
+
+        if self.pattern is not None and not self.pattern.fullmatch(text):
+            return "has an invalid format"
+        return None
+
+
+class RegistrationValidator:
+    """All field rules of one schema version, plus required/accepted field sets."""
+
+    def __init__(self, questions: List[Dict[str, Any]]):
+        self.rules: Dict[str, FieldRule] = {}
+        required = set()
+        for question in questions:
+            entity = question.get("questioned_entity")
+            if not entity:
+                continue
+            try:
+                self.rules[entity] = FieldRule(question)
+            except re.error:
+                # A broken regex in the sheet must not take registration down
+                question = {**question, "validation_regex": ""}
+                self.rules[entity] = FieldRule(question)
+            if (question.get("is_mandatory") or "").upper() == "Y":
+                required.add(entity)
+
+        self.accepted_fields: FrozenSet[str] = frozenset(self.rules)
+        self.required_fields: FrozenSet[str] = frozenset(required)
+
+    def field_errors(self, data: Dict[str, Any]) -> Dict[str, str]:
+        """Check the values of known fields in `data`; unknown fields and blank values are ignored."""
+        errors = {}
+        for key, value in data.items():
+            rule = self.rules.get(key)
+            if rule is None or is_blank(value):
+                continue
+            error = rule.check(value)
+            if error:
+                errors[key] = error
+        return errors
+
+    def validate(self, payload: Dict[str, Any]) -> Tuple[bool, str]:
+        """Validate a complete registration payload. Returns (is_valid, error_message)."""
+        # Check for required fields; a blank value doesn't answer one
+        answered = {key for key, value in payload.items() if not is_blank(value)}
+        missing = self.required_fields - answered
+        if missing:
+            return False, f"Missing required fields: {', '.join(sorted(missing))}"
+
+        # Check for unexpected fields
+        unexpected = set(payload.keys()) - self.accepted_fields
+        if unexpected:
+            return False, f"Unexpected fields detected: {', '.join(sorted(unexpected))}"
+
+        errors = self.field_errors(payload)
+        if errors:
+            details = "; ".join(f"{key} {error}" for key, error in sorted(errors.items()))
+            return False, f"Invalid fields: {details}"
+
+        return True, ""
+
+
+_validators: "OrderedDict[str, RegistrationValidator]" = OrderedDict()
+_validators_lock = threading.Lock()
+# Fast path: the question cache hands out the same list object until it refreshes
+_last_questions: Optional[List[Dict[str, Any]]] = None
+_last_validator: Optional[RegistrationValidator] = None
+
+
+def get_validator(
+    questions: List[Dict[str, Any]], version: Optional[str] = None
+) -> RegistrationValidator:
+    """Return the compiled validator for a schema, compiling it once per version."""
+    global _last_questions, _last_validator
+    with _validators_lock:
+        if questions is _last_questions and _last_validator is not None:
+            return _last_validator
+
+    version = version or schema_version(questions)
+    with _validators_lock:
+        validator = _validators.get(version)
+        if validator is None:
+            validator = RegistrationValidator(questions)
+            _validators[version] = validator
+            while len(_validators) > MAX_CACHED_VALIDATORS:
+                _validators.popitem(last=False)
+        else:
+            _validators.move_to_end(version)
+        _last_questions, _last_validator = questions, validator
+    return validator
@@ -15,8 +15,12 @@ document.addEventListener('DOMContentLoaded', function() {
     const chatbotSend = document.getElementById('chatbotSend');
     const chatbotMessages = document.getElementById('chatbotMessages');
     
+    // The server serves the form first while the agent is degraded
+    const container = document.querySelector('.container');
+    const fallbackNotice = document.getElementById('fallbackNotice');
+
     // Get initial labels - toggle starts with "Form" when in chatbot mode
-    let isChatbotMode = true;
+    let isChatbotMode = !(container && container.dataset.initialMode === 'form');
     const chatbotLabel = 'Agentic';
     const legacyLabel = 'Form';
     
@@ -26,10 +30,10 @@ document.addEventListener('DOMContentLoaded', function() {
         chatbotSend.disabled = false;
     }
     
-    // Toggle view function
-    modeToggle.addEventListener('click', function() {
-        isChatbotMode = !isChatbotMode;
-        
+    function setMode(chatbotMode) {
+        isChatbotMode = chatbotMode;
+        modeToggle.checked = chatbotMode;
+
         if (isChatbotMode) {
             // Switch to chatbot view
             chatbotView.classList.add('active');
@@ -42,7 +46,45 @@ document.addEventListener('DOMContentLoaded', function() {
             chatbotView.classList.remove('active');
             modeToggle.setAttribute('aria-label', chatbotLabel);
         }
+    }
+
+    // Toggle view function
+    modeToggle.addEventListener('click', function() {
+        setMode(!isChatbotMode);
     });
+
+    // Fill empty form fields with the answers the agent already collected
+    function prefillForm() {
+        if (!onboardingForm) return;
+
+        fetch('/api/form_prefill')
+        .then(response => response.json())
+        .then(result => {
+            if (!result.success) return;
+            Object.entries(result.values || {}).forEach(([name, value]) => {
+                const field = onboardingForm.elements.namedItem(name);
+                if (field && !field.value) {
+                    field.value = value;
+                }
+            });
+        })
+        .catch(error => {
+            console.error('Error:', error);
+        });
+    }
+
+    // Move the visitor to the form when the agent is overloaded or too slow
+    function switchToForm() {
+        if (fallbackNotice) {
+            fallbackNotice.hidden = false;
+        }
+        setMode(false);
+        prefillForm();
+    }
+
+    if (!isChatbotMode) {
+        prefillForm();
+    }
     
     // Chatbot functionality
     function sendChatMessage() {
@@ -58,33 +100,54 @@ document.addEventListener('DOMContentLoaded', function() {
         // Show loading indicator
         const loadingMessage = addMessageToChat('Thinking...', 'bot');
         
-        // Send to backend
-        fetch('/api/agent_chat', {
+        // Send to backend and render each part as soon as it is streamed
+        let receivedText = false;
+        const showPart = (text) => {
+            if (!receivedText) {
+                // Remove loading message once the first part arrives
+                loadingMessage.remove();
+                receivedText = true;
+            }
+            addMessageToChat(text, 'bot');
+        };
+
+        fetch('/api/agent_chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
             },
             body: JSON.stringify({ message: message })
         })
-        .then(response => response.json())
-        .then(result => {
-            // Remove loading message
-            loadingMessage.remove();
-            
-            if (result.success) {
-                if (Array.isArray(result.response)) {
-                    result.response.forEach(msg => addMessageToChat(msg, 'bot'));
-                } else {
-                    addMessageToChat(result.response, 'bot');
-                }
-            } else {
-                addMessageToChat('Error: ' + (result.error || 'Failed to get response'), 'bot');
+        .then(response => {
+            if (!response.ok || !response.body) {
+                return response.json().then(result => {
+                    const error = new Error(result.error || 'Failed to get response');
+                    // 503: no capacity for the turn, 504: the turn ran out of time
+                    error.fallbackToForm = response.status === 503 || response.status === 504;
+                    throw error;
+                });
             }
+            return readEventStream(response.body, (eventName, data) => {
+                if (eventName === 'error') {
+                    const error = new Error(data.error || 'Failed to get response');
+                    error.fallbackToForm = Boolean(data.timeout);
+                    throw error;
+                }
+                if (eventName === 'message' && data.text) {
+                    showPart(data.text);
+                }
+            });
         })
         .catch(error => {
             console.error('Error:', error);
-            loadingMessage.remove();
-            addMessageToChat('An error occurred. Please try again.', 'bot');
+            if (!receivedText) {
+                loadingMessage.remove();
+            }
+            addMessageToChat('Error: ' + (error.message || 'An error occurred. Please try again.'), 'bot');
+            if (error.fallbackToForm) {
+                switchToForm();
+            }
         })
         .finally(() => {
             chatbotInput.disabled = false;
@@ -92,6 +155,38 @@ document.addEventListener('DOMContentLoaded', function() {
             chatbotInput.focus();
         });
     }
+
+    // Read a Server-Sent Events body, calling onEvent(eventName, data) per event
+    async function readEventStream(body, onEvent) {
+        const reader = body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let dataText = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.startsWith('data:')) {
+                        dataText += line.slice(5).trim();
+                    }
+                });
+
+                if (eventName === 'done') return;
+                onEvent(eventName, dataText ? JSON.parse(dataText) : {});
+            }
+        }
+    }
     
     function addMessageToChat(message, type) {
         const messageDiv = document.createElement('div');
@@ -104,6 +199,29 @@ document.addEventListener('DOMContentLoaded', function() {
         return messageDiv;
     }
     
+    // Show the opening question the server generated while the page was loading
+    function loadOpeningMessage() {
+        const loadingMessage = addMessageToChat('Thinking...', 'bot');
+
+        fetch('/api/agent_chat/opening')
+        .then(response => response.json())
+        .then(result => {
+            if (result.success) {
+                result.response.forEach(msg => addMessageToChat(msg, 'bot'));
+            }
+        })
+        .catch(error => {
+            console.error('Error:', error);
+        })
+        .finally(() => {
+            loadingMessage.remove();
+        });
+    }
+
+    if (chatbotMessages && chatbotMessages.dataset.opening === 'true') {
+        loadOpeningMessage();
+    }
+    
     // Chatbot send button click
     if (chatbotSend) {
         chatbotSend.addEventListener('click', sendChatMessage);
@@ -0,0 +1,48 @@
+"""Streamed agent turns under admission control, with the ADK runner faked out."""
+import asyncio
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_funcs.agents import agent_singleton  # noqa: E402
+from custom_funcs.agents.admission import AgentTurnTimeoutError, TurnAdmission  # noqa: E402
+
+
+async def _slow_turn(prompt, session_id, wait_for_prewarm=True):
+    await asyncio.sleep(5)
+    yield "too late"
+
+
+def _drain_in_thread(parts):
+    """Consume a stream on another thread; return (thread, outcome dict)."""
+    outcome = {}
+
+    def consume():
+        try:
+            outcome["parts"] = list(parts)
+        except Exception as exc:
+            outcome["error"] = exc
+
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def test_stream_ends_when_turn_times_out_while_queued(monkeypatch):
+    monkeypatch.setattr(agent_singleton, "_iter_text_parts", _slow_turn)
+    monkeypatch.setattr(
+        agent_singleton,
+        "turn_admission",
+        TurnAdmission(max_concurrent=1, max_queued=1, turn_timeout=0.5, retry_after=1),
+    )
+
+    running = agent_singleton.stream_agent("hi", "session-running")
+    queued = agent_singleton.stream_agent("hi", "session-queued")
+
+    threads = [_drain_in_thread(running), _drain_in_thread(queued)]
+    for thread, outcome in threads:
+        thread.join(timeout=3)
+        assert not thread.is_alive(), "stream consumer still blocked after the turn deadline"
+        assert isinstance(outcome.get("error"), AgentTurnTimeoutError)